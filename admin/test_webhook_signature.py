@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+"""
+Test script for the /webhook signature check
+
+Sends webhook deliveries with valid and invalid X-Hub-Signature-256 headers
+against a running server configured with GITHUB_WEBHOOK_SECRET.
+
+Usage: python test_webhook_signature.py
+"""
+
+import hashlib
+import hmac
+import json
+import requests
+import os
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Webhook configuration
+GITHUB_WEBHOOK_SECRET = os.getenv("GITHUB_WEBHOOK_SECRET", "")
+BASE_URL = "http://localhost:8000"  # Change to your API URL
+
+PAYLOAD = json.dumps({"ref": "refs/heads/main"}).encode("utf-8")
+
+def post_webhook(signature):
+    """Send a push delivery with the given signature header and return the status code"""
+    headers = {
+        "X-GitHub-Event": "push",
+        "X-Hub-Signature-256": signature,
+        "Content-Type": "application/json"
+    }
+    response = requests.post(f"{BASE_URL}/webhook", data=PAYLOAD, headers=headers)
+    print(f"Status Code: {response.status_code}")
+    print(f"Response: {response.text}")
+    return response.status_code
+
+def test_valid_signature():
+    """Test a correctly signed delivery - should be accepted (200)"""
+    print("Testing VALID signature...")
+    signature = "sha256=" + hmac.new(GITHUB_WEBHOOK_SECRET.encode("utf-8"), PAYLOAD, hashlib.sha256).hexdigest()
+    try:
+        status = post_webhook(signature)
+        print("PASS" if status == 200 else "FAIL: expected 200")
+    except Exception as e:
+        print(f"Error: {e}")
+    print()
+
+def test_wrong_signature():
+    """Test a delivery signed with the wrong secret - should cause 401"""
+    print("Testing WRONG signature (should cause 401)...")
+    try:
+        status = post_webhook("sha256=" + "0" * 64)
+        print("PASS" if status == 401 else "FAIL: expected 401")
+    except Exception as e:
+        print(f"Error: {e}")
+    print()
+
+def test_non_ascii_signature():
+    """Test a signature header with non-ASCII characters - should cause 401, not 500"""
+    print("Testing NON-ASCII signature (should cause 401)...")
+    try:
+        # requests sends str header values as latin-1
+        status = post_webhook("sha256=café")
+        print("PASS" if status == 401 else "FAIL: expected 401")
+    except Exception as e:
+        print(f"Error: {e}")
+    print()
+
+def main():
+    """Run all tests"""
+    print("Running webhook signature tests...")
+    print(f"Base URL: {BASE_URL}")
+    print()
+    
+    if not GITHUB_WEBHOOK_SECRET:
+        print("GITHUB_WEBHOOK_SECRET is not set: a valid signature cannot be computed for the server's secret")
+        return
+    
+    test_valid_signature()
+    test_wrong_signature()
+    test_non_ascii_signature()
+
+if __name__ == "__main__":
+    main()
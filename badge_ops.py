@@ -4,13 +4,66 @@ Badge operations module for README.md badge management
 
 import os
 import base64
-import httpx
+import asyncio
+import orjson
 import logging
+from collections import OrderedDict
 from typing import Dict, Any, List, Optional
-from github_api import generate_jwt_token, get_installation_token
+from github_api import generate_jwt_token, get_installation_token, github_client
 
 logger = logging.getLogger(__name__)
 
+# README updates allowed in flight at once; each one is two GitHub API round trips
+MAX_CONCURRENT_BADGE_UPDATES = 8
+_badge_semaphore = asyncio.Semaphore(MAX_CONCURRENT_BADGE_UPDATES)
+
+# GitHub's secondary rate limit answers 403/429 with Retry-After; wait and retry a few times
+# (waits are capped so the setup page a user is waiting on does not hang)
+BADGE_MAX_RETRIES = 2
+RETRY_AFTER_MAX = 30
+
+# ETag of the last README seen already carrying the badge, keyed by (repository full name, badge URL);
+# a 304 for it means the badge is still there without downloading the README again.
+# Kept as an LRU of at most README_ETAG_CACHE_SIZE entries
+README_ETAG_CACHE_SIZE = 1024
+_badged_readme_etags = OrderedDict()
+
+
+def _base64_contains(encoded: str, needle: bytes) -> bool:
+    """Check whether the data behind a base64 string contains needle, without decoding it"""
+    for shift, skip in ((0, 0), (1, 2), (2, 3)):
+        # Encode the needle as if it started `shift` bytes into a 3-byte group, then drop the
+        # characters that also depend on the bytes before or after it
+        total = shift + len(needle)
+        pattern = base64.b64encode(bytes(shift) + needle).decode("ascii").rstrip("=")
+        if total % 3:
+            pattern = pattern[:-1]
+        pattern = pattern[skip:]
+        index = encoded.find(pattern)
+        while index != -1:
+            # The edge characters only carry part of the needle's first and last bytes,
+            # so confirm an aligned candidate by decoding just the groups around it
+            if index % 4 == skip:
+                start = index - skip
+                end = min(len(encoded), (index + len(pattern)) // 4 * 4 + 4)
+                if needle in base64.b64decode(encoded[start:end]):
+                    return True
+            index = encoded.find(pattern, index + 1)
+    return False
+
+
+async def _github_request(method: str, url: str, **kwargs):
+    """Send a request on the shared client, honouring Retry-After on rate-limit responses"""
+    for attempt in range(BADGE_MAX_RETRIES + 1):
+        response = await github_client.request(method, url, **kwargs)
+        retry_after = response.headers.get("Retry-After")
+        rate_limited = response.status_code == 429 or (response.status_code == 403 and retry_after)
+        if not rate_limited or attempt == BADGE_MAX_RETRIES:
+            return response
+        delay = min(int(retry_after), RETRY_AFTER_MAX) if retry_after and retry_after.isdigit() else 5
+        logger.warning(f"GitHub rate limit on {method} {url}, retrying in {delay}s")
+        await asyncio.sleep(delay)
+
 
 async def add_badge_to_readme(git_username: str, repository_name: str, installation_token: str, base_url: str = None) -> bool:
     """
@@ -23,79 +76,90 @@ async def add_badge_to_readme(git_username: str, repository_name: str, installat
     badge_markdown = f"[![Compilation Status]({badge_url})]({badge_url})"
     
     try:
-        async with httpx.AsyncClient() as client:
-            # Get current README.md content
-            readme_response = await client.get(
-                f"https://api.github.com/repos/{git_username}/{repository_name}/readme",
-                headers={
-                    "Authorization": f"Bearer {installation_token}",
-                    "Accept": "application/vnd.github.v3+json",
-                    "X-GitHub-Api-Version": "2022-11-28"
-                }
-            )
-                        
-            if readme_response.status_code == 200:
-                readme_data = readme_response.json()                
-                current_content = base64.b64decode(readme_data["content"]).decode('utf-8')
-                sha = readme_data["sha"]
-                
-                # Check if badge already exists
-                if badge_url in current_content:
-                    logger.info(f"Badge already exists in {git_username}/{repository_name}")
-                    return True
-                
-                # Add badge at the top of README
-                new_content = f"# {repository_name}\n\n{badge_markdown}\n\n" + current_content.lstrip()
-                
-                # If README starts with a title, add badge after it
-                lines = current_content.split('\n')
-                if lines and lines[0].startswith('#'):
-                    # Find the first non-title line
-                    insert_index = 1
-                    while insert_index < len(lines) and (lines[insert_index].startswith('#') or lines[insert_index].strip() == ''):
-                        insert_index += 1
-                    
-                    lines.insert(insert_index, f"\n{badge_markdown}\n")
-                    new_content = '\n'.join(lines)
-                
-            elif readme_response.status_code == 404:
-                # README doesn't exist, create one with the badge
-                new_content = f"# {repository_name}\n\n{badge_markdown}\n\nThis repository is monitored by Compiler Tester for automatic compilation status.\n"
-                sha = None
-            else:
-                logger.error(f"Failed to get README for {git_username}/{repository_name}: {readme_response.status_code}")
-                return False
+        # Get current README.md content
+        etag_key = (f"{git_username}/{repository_name}", badge_url)
+        headers = {"Authorization": f"Bearer {installation_token}"}
+        if etag_key in _badged_readme_etags:
+            _badged_readme_etags.move_to_end(etag_key)
+            headers["If-None-Match"] = _badged_readme_etags[etag_key]
+        
+        readme_response = await _github_request(
+            "GET",
+            f"/repos/{git_username}/{repository_name}/readme",
+            headers=headers
+        )
+        
+        if readme_response.status_code == 304:
+            logger.info(f"Badge already exists in {git_username}/{repository_name} (README unchanged)")
+            return True
+        
+        if readme_response.status_code == 200:
+            readme_data = orjson.loads(readme_response.content)
+            # GitHub wraps the base64 content in lines
+            encoded_content = readme_data["content"].replace("\n", "")
             
-            # Update README.md
-            update_data = {
-                "message": "Add compilation status badge",
-                "content": base64.b64encode(new_content.encode('utf-8')).decode('utf-8'),
-                "committer": {
-                    "name": "Compiler Tester Bot",
-                    "email": "compiler-tester@insper.edu.br"
-                }
-            }
+            # Check if badge already exists (on the encoded content, so a badged README is never decoded)
+            if _base64_contains(encoded_content, badge_url.encode('utf-8')):
+                logger.info(f"Badge already exists in {git_username}/{repository_name}")
+                if readme_response.headers.get("ETag"):
+                    _badged_readme_etags[etag_key] = readme_response.headers["ETag"]
+                    _badged_readme_etags.move_to_end(etag_key)
+                    if len(_badged_readme_etags) > README_ETAG_CACHE_SIZE:
+                        _badged_readme_etags.popitem(last=False)
+                return True
             
-            if sha:
-                update_data["sha"] = sha
+            current_content = base64.b64decode(encoded_content).decode('utf-8')
+            sha = readme_data["sha"]
             
-            update_response = await client.put(
-                f"https://api.github.com/repos/{git_username}/{repository_name}/contents/README.md",
-                headers={
-                    "Authorization": f"Bearer {installation_token}",
-                    "Accept": "application/vnd.github.v3+json",
-                    "X-GitHub-Api-Version": "2022-11-28"
-                },
-                json=update_data
-            )
+            # Add badge at the top of README
+            new_content = f"# {repository_name}\n\n{badge_markdown}\n\n" + current_content.lstrip()
             
-            if update_response.status_code in [200, 201]:
-                logger.info(f"Successfully added badge to {git_username}/{repository_name}")
-                return True
-            else:
-                logger.error(f"Failed to update README for {git_username}/{repository_name}: {update_response.status_code} - {update_response.text}")
-                return False
+            # If README starts with a title, add badge after it
+            lines = current_content.split('\n')
+            if lines and lines[0].startswith('#'):
+                # Find the first non-title line
+                insert_index = 1
+                while insert_index < len(lines) and (lines[insert_index].startswith('#') or lines[insert_index].strip() == ''):
+                    insert_index += 1
                 
+                lines.insert(insert_index, f"\n{badge_markdown}\n")
+                new_content = '\n'.join(lines)
+            
+        elif readme_response.status_code == 404:
+            # README doesn't exist, create one with the badge
+            new_content = f"# {repository_name}\n\n{badge_markdown}\n\nThis repository is monitored by Compiler Tester for automatic compilation status.\n"
+            sha = None
+        else:
+            logger.error(f"Failed to get README for {git_username}/{repository_name}: {readme_response.status_code}")
+            return False
+        
+        # Update README.md
+        update_data = {
+            "message": "Add compilation status badge",
+            "content": base64.b64encode(new_content.encode('utf-8')).decode('utf-8'),
+            "committer": {
+                "name": "Compiler Tester Bot",
+                "email": "compiler-tester@insper.edu.br"
+            }
+        }
+        
+        if sha:
+            update_data["sha"] = sha
+        
+        update_response = await _github_request(
+            "PUT",
+            f"/repos/{git_username}/{repository_name}/contents/README.md",
+            headers={"Authorization": f"Bearer {installation_token}", "Content-Type": "application/json"},
+            content=orjson.dumps(update_data)
+        )
+        
+        if update_response.status_code in [200, 201]:
+            logger.info(f"Successfully added badge to {git_username}/{repository_name}")
+            return True
+        else:
+            logger.error(f"Failed to update README for {git_username}/{repository_name}: {update_response.status_code} - {update_response.text}")
+            return False
+            
     except Exception as e:
         logger.error(f"Error adding badge to {git_username}/{repository_name}: {e}")
         return False
@@ -112,6 +176,7 @@ async def add_badges_to_installation_repos(installation_id: int, repositories: L
         jwt_token = generate_jwt_token()
         installation_token = await get_installation_token(installation_id, jwt_token)
         
+        pending = []
         for repo in repositories:
             repo_full_name = repo.get("full_name", "")
             if "/" in repo_full_name:
@@ -131,8 +196,21 @@ async def add_badges_to_installation_repos(installation_id: int, repositories: L
                     results[repo_full_name] = False
                     continue
                 
-                success = await add_badge_to_readme(git_username, repository_name, installation_token, base_url)
-                results[repo_full_name] = success
+                pending.append((repo_full_name, git_username, repository_name))
+        
+        async def add_badge(git_username: str, repository_name: str) -> bool:
+            async with _badge_semaphore:
+                return await add_badge_to_readme(git_username, repository_name, installation_token, base_url)
+        
+        # Update every README concurrently instead of one repository after another
+        outcomes = await asyncio.gather(
+            *(add_badge(git_username, repository_name) for _, git_username, repository_name in pending),
+            return_exceptions=True
+        )
+        for (repo_full_name, _, _), outcome in zip(pending, outcomes):
+            if isinstance(outcome, Exception):
+                logger.error(f"Error adding badge to {repo_full_name}: {outcome}")
+            results[repo_full_name] = outcome is True
                 
     except Exception as e:
         logger.error(f"Error adding badges to installation {installation_id}: {e}")
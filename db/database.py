@@ -1,8 +1,21 @@
 import sqlite3
 import os
+import time
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
 from typing import List, Dict, Any, Optional
 from datetime import datetime
 
+# Seconds a cached lookup of near-static rows (repository, semester) stays valid
+CACHE_TTL = 60
+# Most lookups kept in that cache (one per repository and per semester seen by tag events);
+# the least recently used one is dropped beyond this
+CACHE_MAX_ENTRIES = 1024
+
+# Seconds a connection waits on a locked database before raising
+SQLITE_BUSY_TIMEOUT = 10
+
 
 class DatabaseManager:
     def __init__(self, db_path: str = None):
@@ -12,27 +25,82 @@ class DatabaseManager:
             db_path = os.path.join(current_dir, 'compilers.db')
         
         self.db_path = db_path
+        self._cache = OrderedDict()
+        # Lookups run on worker threads (asyncio.to_thread), so the LRU bookkeeping is locked
+        self._cache_lock = threading.Lock()
+        # One connection per thread, kept open so sqlite3's prepared-statement cache survives between calls
+        self._local = threading.local()
+    
+    def _cached(self, key, loader):
+        """Return the cached rows for key, calling loader() when missing or expired
+        (used by get_repository_info and get_semester_info)"""
+        now = time.monotonic()
+        with self._cache_lock:
+            entry = self._cache.get(key)
+            if entry is not None and entry[0] > now:
+                self._cache.move_to_end(key)
+                return entry[1]
+        value = loader()
+        with self._cache_lock:
+            self._cache[key] = (now + CACHE_TTL, value)
+            self._cache.move_to_end(key)
+            if len(self._cache) > CACHE_MAX_ENTRIES:
+                self._cache.popitem(last=False)
+        return value
+    
+    def clear_cache(self):
+        """Drop all cached lookups (called after writes to Repository)"""
+        with self._cache_lock:
+            self._cache.clear()
+    
+    @contextmanager
+    def transaction(self, conn: sqlite3.Connection = None):
+        """Yield a connection whose writes commit together, or roll back on error.
+        When conn is given (already inside a transaction) it is yielded as-is."""
+        if conn is not None:
+            yield conn
+            return
+        conn = self.get_connection()
+        try:
+            yield conn
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            self.clear_cache()
     
     def get_connection(self):
-        """Get a database connection with foreign keys enabled"""
-        conn = sqlite3.connect(self.db_path)
-        # conn.execute("PRAGMA foreign_keys = ON")
-        conn.row_factory = sqlite3.Row  # Enable column access by name
+        """Get this thread's database connection, opening it on first use.
+        Use it as a context manager (commit/rollback); it is not closed between calls."""
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.db_path != self.db_path:
+            conn = sqlite3.connect(self.db_path, cached_statements=256, timeout=SQLITE_BUSY_TIMEOUT)
+            # conn.execute("PRAGMA foreign_keys = ON")
+            # WAL lets badge/webhook reads proceed while a write is in flight; NORMAL sync is safe under WAL
+            conn.execute("PRAGMA journal_mode = WAL")
+            conn.execute("PRAGMA synchronous = NORMAL")
+            conn.execute("PRAGMA cache_size = -8000")
+            conn.row_factory = sqlite3.Row  # Enable column access by name
+            self._local.conn = conn
+            self._local.db_path = self.db_path
         return conn
 
     def get_repository_info(self, git_username: str, repository_name: str) -> Optional[Dict[str, Any]]:
         """Get repository information including installation_id"""
-        with self.get_connection() as conn:
-            cursor = conn.cursor()
-            cursor.execute("""
-                SELECT r.*, s.language, s.extension, s.secret 
-                FROM Repository r
-                JOIN Semester s ON r.semester_name = s.name
-                WHERE r.git_username = ? AND r.repository_name = ?
-            """, (git_username, repository_name))
-            
-            row = cursor.fetchone()
-            return dict(row) if row else None 
+        def load():
+            with self.get_connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute("""
+                    SELECT r.*, s.language, s.extension, s.secret 
+                    FROM Repository r
+                    JOIN Semester s ON r.semester_name = s.name
+                    WHERE r.git_username = ? AND r.repository_name = ?
+                """, (git_username, repository_name))
+                return cursor.fetchone()
+        
+        row = self._cached(('repository', git_username, repository_name), load)
+        return dict(row) if row else None 
     
     def get_repository_status(self, git_username: str, repository_name: str) -> Optional[Dict[str, Any]]:
         """Get the current status of a repository across all versions"""
@@ -53,6 +121,27 @@ class DatabaseManager:
             # Convert to list of dictionaries
             return [dict(row) for row in rows]
     
+    def get_repository_status_key(self, git_username: str, repository_name: str) -> Optional[tuple]:
+        """Return a cheap fingerprint of everything ReleaseStatus depends on for a repository"""
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("""
+                SELECT r.semester_name,
+                       (SELECT COUNT(*) FROM TestResult t
+                         WHERE t.git_username = r.git_username AND t.repository_name = r.repository_name),
+                       (SELECT MAX(date_run) FROM TestResult t
+                         WHERE t.git_username = r.git_username AND t.repository_name = r.repository_name),
+                       (SELECT COUNT(*) FROM Version v
+                         WHERE v.semester_name = r.semester_name AND v.date_from < datetime('now', '-3 hour')),
+                       (SELECT COUNT(*) FROM Version v
+                         WHERE v.semester_name = r.semester_name AND v.date_to < datetime('now', '-3 hour'))
+                FROM Repository r
+                WHERE r.git_username = ? AND r.repository_name = ?
+            """, (git_username, repository_name))
+            
+            row = cursor.fetchone()
+            return tuple(row) if row else None
+    
     def get_overall_repository_status(self, git_username: str, repository_name: str) -> str:
         """Get overall status for badge generation"""
         statuses = self.get_repository_status(git_username, repository_name)
@@ -162,11 +251,14 @@ class DatabaseManager:
     
     def get_semester_info(self, semester_name: str) -> Optional[Dict[str, Any]]:
         """Get semester information"""
-        with self.get_connection() as conn:
-            cursor = conn.cursor()
-            cursor.execute("SELECT * FROM Semester WHERE name = ?", (semester_name,))
-            row = cursor.fetchone()
-            return dict(row) if row else None
+        def load():
+            with self.get_connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute("SELECT * FROM Semester WHERE name = ?", (semester_name,))
+                return cursor.fetchone()
+        
+        row = self._cached(('semester', semester_name), load)
+        return dict(row) if row else None
 
     def get_version_info(self, semester_name: str, version_name: str) -> Optional[Dict[str, Any]]:
         """Get version info for a given semester and version_name (e.g., v1.2)"""
@@ -204,11 +296,29 @@ class DatabaseManager:
                     VALUES (?, ?, '', 0, '', ?, '')
                 """, (git_username, repository_name, installation_id))
                 conn.commit()
+                self.clear_cache()
                 return True
         except Exception as e:
             print(f"Error saving repository with installation: {e}")
             return False
     
+    def save_repositories_with_installation(self, rows: List[tuple]) -> bool:
+        """Save many (git_username, repository_name, installation_id) rows in one transaction"""
+        try:
+            with self.get_connection() as conn:
+                cursor = conn.cursor()
+                cursor.executemany("""
+                    INSERT OR REPLACE INTO Repository 
+                    (git_username, repository_name, semester_name, compiled, program_call, installation_id, language)
+                    VALUES (?, ?, '', 0, '', ?, '')
+                """, rows)
+                conn.commit()
+                self.clear_cache()
+                return True
+        except Exception as e:
+            print(f"Error saving repositories with installation: {e}")
+            return False
+    
     def update_repository_details(self, git_username: str, repository_name: str, 
                                 semester_name: str, program_call: str, language: str, compiled: int) -> bool:
         """Update repository with complete details"""
@@ -221,6 +331,7 @@ class DatabaseManager:
                     WHERE git_username = ? AND repository_name = ?
                 """, (semester_name, program_call, compiled, language, git_username, repository_name))
                 conn.commit()
+                self.clear_cache()
                 return True
         except Exception as e:
             print(f"Error updating repository details: {e}")
@@ -241,6 +352,52 @@ class DatabaseManager:
             print(f"Error saving user: {e}")
             return False
     
+    def update_repositories_details(self, rows: List[tuple], conn: sqlite3.Connection = None) -> bool:
+        """Update many repositories from (semester_name, program_call, compiled, language, git_username, repository_name) rows"""
+        try:
+            with self.transaction(conn) as conn:
+                conn.executemany("""
+                    UPDATE Repository 
+                    SET semester_name = ?, program_call = ?, compiled = ?, language = ?
+                    WHERE git_username = ? AND repository_name = ?
+                """, rows)
+                return True
+        except Exception as e:
+            print(f"Error updating repositories details: {e}")
+            return False
+    
+    def get_repository_keys(self, git_usernames: List[str], conn: sqlite3.Connection = None) -> set:
+        """Return the (git_username, repository_name) pairs registered for the given users.
+        Inside a caller's transaction (conn given) errors propagate so the caller can roll back."""
+        outer_transaction = conn is not None
+        try:
+            with self.transaction(conn) as conn:
+                placeholders = ",".join("?" * len(git_usernames))
+                cursor = conn.execute(f"""
+                    SELECT git_username, repository_name
+                    FROM Repository
+                    WHERE git_username IN ({placeholders})
+                """, list(git_usernames))
+                return {(row[0], row[1]) for row in cursor.fetchall()}
+        except Exception as e:
+            if outer_transaction:
+                raise
+            print(f"Error getting repository keys: {e}")
+            return set()
+    
+    def save_or_update_users(self, rows: List[tuple], conn: sqlite3.Connection = None) -> bool:
+        """Save or update many (git_username, name, email) rows in one transaction"""
+        try:
+            with self.transaction(conn) as conn:
+                conn.executemany("""
+                    INSERT OR REPLACE INTO User (git_username, name, email)
+                    VALUES (?, ?, ?)
+                """, rows)
+                return True
+        except Exception as e:
+            print(f"Error saving users: {e}")
+            return False
+    
     def remove_repositories_by_installation(self, installation_id: int) -> bool:
         """Remove all repositories associated with an installation"""
         try:
@@ -273,6 +430,7 @@ class DatabaseManager:
                 
                 deleted_count = cursor.rowcount
                 conn.commit()
+                self.clear_cache()
                 
                 print(f"Removed {deleted_count} repositories for installation {installation_id}")
                 for username, repo_name in repos_to_remove:
@@ -375,6 +533,7 @@ class DatabaseManager:
                 
                 deleted_count = cursor.rowcount
                 conn.commit()
+                self.clear_cache()
                 
                 if deleted_count > 0:
                     print(f"Removed repository {git_username}/{repository_name}")
@@ -385,6 +544,24 @@ class DatabaseManager:
         except Exception as e:
             print(f"Error removing repository {git_username}/{repository_name}: {e}")
             return False
+    
+    def remove_repositories(self, pairs: List[tuple]) -> bool:
+        """Remove many (git_username, repository_name) repositories and their test results in one transaction"""
+        try:
+            with self.transaction() as conn:
+                conn.executemany("""
+                    DELETE FROM TestResult 
+                    WHERE git_username = ? AND repository_name = ?
+                """, pairs)
+                cursor = conn.executemany("""
+                    DELETE FROM Repository 
+                    WHERE git_username = ? AND repository_name = ?
+                """, pairs)
+                print(f"Removed {cursor.rowcount} repositories")
+                return True
+        except Exception as e:
+            print(f"Error removing repositories: {e}")
+            return False
 
 # Global database manager instance
 db_manager = DatabaseManager()
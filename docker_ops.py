@@ -7,9 +7,20 @@ import asyncio
 import logging
 from typing import Optional
 from db.database import db_manager
+from github_api import create_github_issue
 
 logger = logging.getLogger(__name__)
 
+# Seconds a test container may run before it is killed
+DOCKER_TIMEOUT = 180
+
+# Test containers allowed to run at once; leave a couple of cores for the API itself
+MAX_CONCURRENT_CONTAINERS = max(1, (os.cpu_count() or 1) - 2)
+_container_semaphore = asyncio.Semaphore(MAX_CONCURRENT_CONTAINERS)
+
+# Strong references to the monitor tasks so they are not garbage-collected while containers run
+_monitor_tasks = set()
+
 # Callback URL for Docker container
 CALLBACK_URL = os.getenv("CALLBACK_URL", "https://compiler-tester.insper-comp.com.br/api/test-result")
 API_SECRET = os.getenv("API_SECRET", "your-default-secret-change-me")
@@ -60,18 +71,26 @@ async def run_docker_container_async(
         logger.info(f"Starting Docker container for {git_username}/{repository_name}:{release}")
         logger.info(f"Docker command: {' '.join(docker_cmd[:4])} ... (args hidden for security)")
         
-        # Run Docker container asynchronously
-        process = await asyncio.create_subprocess_exec(
-            *docker_cmd,
-            stdout=asyncio.subprocess.PIPE,
-            stderr=asyncio.subprocess.PIPE
-        )
+        # Wait for a free container slot; it is released by the monitor once the container exits
+        await _container_semaphore.acquire()
+        try:
+            # Run Docker container asynchronously
+            process = await asyncio.create_subprocess_exec(
+                *docker_cmd,
+                stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.PIPE
+            )
+        except BaseException:
+            _container_semaphore.release()
+            raise
         
         # Don't wait for completion - let it run in background
         logger.info(f"Docker container started with PID: {process.pid}")
         
         # Optionally log the process completion in background
-        asyncio.create_task(_monitor_docker_process(process, git_username, repository_name, release))
+        task = asyncio.create_task(_monitor_docker_process(process, git_username, repository_name, release))
+        _monitor_tasks.add(task)
+        task.add_done_callback(_monitor_tasks.discard)
         
     except Exception as e:
         logger.error(f"Error starting Docker container for {git_username}/{repository_name}:{release} - {e}")
@@ -85,12 +104,16 @@ async def _monitor_docker_process(process, git_username: str, repository_name: s
         #stdout, stderr = await process.communicate()
         # Wait for process to complete, but enforce timeout
         try:
-            stdout, stderr = await asyncio.wait_for(process.communicate(), timeout=180)
+            stdout, stderr = await asyncio.wait_for(process.communicate(), timeout=DOCKER_TIMEOUT)
         except asyncio.TimeoutError:
-            logger.warning(f"Docker timeout after {timeout}s for {git_username}/{repository_name}:{release}")
+            logger.warning(f"Docker timeout after {DOCKER_TIMEOUT}s for {git_username}/{repository_name}:{release}")
             process.kill()
             await process.wait()
-            repo_info = db_manager.get_repository_info(git_username, repository_name)
+            # sqlite3 is blocking; keep the event loop free while we look up the installation
+            repo_info = await asyncio.to_thread(db_manager.get_repository_info, git_username, repository_name)
+            if not repo_info or not repo_info.get('installation_id'):
+                logger.warning(f"No installation found for {git_username}/{repository_name}, skipping timeout issue")
+                return
             installation_id = repo_info['installation_id']
             url = await create_github_issue(
                 git_username=git_username,
@@ -118,3 +141,5 @@ async def _monitor_docker_process(process, git_username: str, repository_name: s
                 
     except Exception as e:
         logger.error(f"Error monitoring Docker process for {git_username}/{repository_name}:{release} - {e}")
+    finally:
+        _container_semaphore.release()
@@ -1,4 +1,4 @@
-from db.database import DatabaseManager
+from db.database import db_manager
 import os
 
 SVG_FOLDER = 'img/compiler'
@@ -20,7 +20,6 @@ class RepoReport:
     def db_update(self):
         self.taglist = []
 
-        db_manager = DatabaseManager()
         reg = db_manager.get_repository_status(self.git_username, self.repository_name)
         
         if not reg:
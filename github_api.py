@@ -4,11 +4,15 @@ GitHub API operations and authentication module
 
 import os
 import jwt
+import orjson
+import time
 import httpx
 import asyncio
 import logging
-from datetime import datetime, timedelta
+from datetime import datetime
+from functools import lru_cache
 from typing import Dict, Any, Optional
+from cryptography.hazmat.primitives.serialization import load_pem_private_key
 
 logger = logging.getLogger(__name__)
 
@@ -16,6 +20,46 @@ logger = logging.getLogger(__name__)
 GITHUB_APP_ID = os.getenv("GITHUB_APP_ID", "1578480")
 GITHUB_APP_PRIVATE_KEY = os.getenv("GITHUB_APP_PRIVATE_KEY")
 
+# Shared client so TCP/TLS connections to api.github.com are reused across calls
+github_client = httpx.AsyncClient(
+    base_url="https://api.github.com",
+    http2=True,
+    timeout=10.0,
+    limits=httpx.Limits(max_keepalive_connections=32, max_connections=64),
+    headers={
+        "Accept": "application/vnd.github.v3+json",
+        "X-GitHub-Api-Version": "2022-11-28"
+    }
+)
+
+# Seconds a successful get_installation_details response is reused
+INSTALLATION_CACHE_TTL = 60
+# Keyed by str(installation_id): the setup form posts it as a string, webhooks as an int
+_installation_cache: Dict[str, tuple] = {}
+
+# Installation access tokens live about an hour; renew this many seconds early so a
+# token handed to a test container does not expire while the container runs
+TOKEN_REFRESH_MARGIN = 300
+# Keyed by str(installation_id): (expires_at as a Unix timestamp, token)
+_token_cache: Dict[str, tuple] = {}
+
+
+async def close_github_client():
+    """Close the shared GitHub client (called on application shutdown)"""
+    await github_client.aclose()
+
+
+@lru_cache(maxsize=1)
+def _load_private_key(private_key_pem: str):
+    """Parse the App private key once; PyJWT re-parses a PEM string on every encode"""
+    return load_pem_private_key(private_key_pem.encode(), password=None)
+
+
+# App JWTs are valid for 10 minutes; reuse one until shortly before it expires
+JWT_LIFETIME = 600
+JWT_REFRESH_MARGIN = 60
+_jwt_cache = {"key": None, "token": None, "exp": 0}
+
 
 def generate_jwt_token() -> str:
     """Generate JWT token for GitHub App authentication"""
@@ -26,10 +70,15 @@ def generate_jwt_token() -> str:
     if not GITHUB_APP_PRIVATE_KEY or "Replace with" in GITHUB_APP_PRIVATE_KEY:
         raise Exception("GitHub App private key not configured")
     
+    now = int(time.time())
+    cache_key = (GITHUB_APP_ID, GITHUB_APP_PRIVATE_KEY)
+    if _jwt_cache["key"] == cache_key and now < _jwt_cache["exp"] - JWT_REFRESH_MARGIN:
+        return _jwt_cache["token"]
+    
     try:
         payload = {
-            'iat': datetime.utcnow(),
-            'exp': datetime.utcnow() + timedelta(minutes=10),
+            'iat': now,
+            'exp': now + JWT_LIFETIME,
             'iss': GITHUB_APP_ID
         }
         
@@ -37,7 +86,8 @@ def generate_jwt_token() -> str:
         logger.info(f"Generating JWT for App ID: {GITHUB_APP_ID}")
         logger.info(f"Private key starts with: {GITHUB_APP_PRIVATE_KEY[:30]}...")
         
-        token = jwt.encode(payload, GITHUB_APP_PRIVATE_KEY, algorithm='RS256')
+        token = jwt.encode(payload, _load_private_key(GITHUB_APP_PRIVATE_KEY), algorithm='RS256')
+        _jwt_cache.update(key=cache_key, token=token, exp=payload['exp'])
         logger.info("JWT token generated successfully")
         return token
         
@@ -48,55 +98,69 @@ def generate_jwt_token() -> str:
 
 async def get_installation_token(installation_id: int, jwt_token: str) -> str:
     """Get installation access token"""
+    entry = _token_cache.get(str(installation_id))
+    if entry is not None and time.time() < entry[0] - TOKEN_REFRESH_MARGIN:
+        return entry[1]
+    
     try:
         GITHUB_APP_ID = os.getenv("GITHUB_APP_ID", "1578480")
         GITHUB_APP_PRIVATE_KEY = os.getenv("GITHUB_APP_PRIVATE_KEY")
         logger.info(f"Requesting access token for installation {installation_id}")
         
-        async with httpx.AsyncClient() as client:
-            response = await client.post(
-                f"https://api.github.com/app/installations/{installation_id}/access_tokens",
-                headers={
-                    "Authorization": f"Bearer {jwt_token}",
-                    "Accept": "application/vnd.github.v3+json",
-                    "X-GitHub-Api-Version": "2022-11-28"
-                }
-            )
-            
-            logger.info(f"GitHub API response status: {response.status_code}")
+        response = await github_client.post(
+            f"/app/installations/{installation_id}/access_tokens",
+            headers={"Authorization": f"Bearer {jwt_token}"}
+        )
+        
+        logger.info(f"GitHub API response status: {response.status_code}")
+        
+        if response.status_code == 201:
+            data = orjson.loads(response.content)
+            logger.info("Successfully obtained installation access token")
+            expires_at = data.get("expires_at")
+            if expires_at:
+                expiry = datetime.fromisoformat(expires_at.replace("Z", "+00:00")).timestamp()
+                _token_cache[str(installation_id)] = (expiry, data["token"])
+            return data["token"]
+        else:
+            logger.error(f"GitHub API error: {response.status_code}")
+            logger.error(f"Response body: {response.text}")
+            logger.error(f"Response headers: {dict(response.headers)}")
             
-            if response.status_code == 201:
-                data = response.json()
-                logger.info("Successfully obtained installation access token")
-                return data["token"]
-            else:
-                logger.error(f"GitHub API error: {response.status_code}")
-                logger.error(f"Response body: {response.text}")
-                logger.error(f"Response headers: {dict(response.headers)}")
-                
-                # Common error interpretations
-                if response.status_code == 401:
-                    error_text = response.text
-                    if "Integration must generate a public key" in error_text:
-                        raise Exception("JWT signature verification failed. Check private key format.")
-                    elif "Bad credentials" in error_text:
-                        raise Exception("Invalid GitHub App credentials. Check App ID and private key.")
-                    else:
-                        raise Exception(f"Authentication failed: {error_text}")
-                elif response.status_code == 404:
-                    raise Exception(f"Installation {installation_id} not found. App may not be installed.")
+            # Common error interpretations
+            if response.status_code == 401:
+                error_text = response.text
+                if "Integration must generate a public key" in error_text:
+                    raise Exception("JWT signature verification failed. Check private key format.")
+                elif "Bad credentials" in error_text:
+                    raise Exception("Invalid GitHub App credentials. Check App ID and private key.")
                 else:
-                    raise Exception(f"GitHub API error {response.status_code}: {response.text}")
+                    raise Exception(f"Authentication failed: {error_text}")
+            elif response.status_code == 404:
+                raise Exception(f"Installation {installation_id} not found. App may not be installed.")
+            else:
+                raise Exception(f"GitHub API error {response.status_code}: {response.text}")
                     
     except Exception as e:
         logger.error(f"Error getting installation access token: {e}")
         raise
 
 
+def invalidate_installation_details(installation_id: int):
+    """Forget the cached details and access token of an installation (its repositories changed)"""
+    _installation_cache.pop(str(installation_id), None)
+    _token_cache.pop(str(installation_id), None)
+
+
 async def get_installation_details(installation_id: int) -> Dict[str, Any]:
     """
     Fetch installation details from GitHub API
     """
+    entry = _installation_cache.get(str(installation_id))
+    if entry is not None and entry[0] > time.monotonic():
+        # Copy so callers cannot mutate the cached response
+        return {**entry[1], "repositories": list(entry[1].get("repositories", []))}
+    
     try:
         GITHUB_APP_ID = os.getenv("GITHUB_APP_ID", "1578480")
         GITHUB_APP_PRIVATE_KEY = os.getenv("GITHUB_APP_PRIVATE_KEY")
@@ -107,36 +171,28 @@ async def get_installation_details(installation_id: int) -> Dict[str, Any]:
         installation_token = await get_installation_token(installation_id, jwt_token)
         
         # Fetch installation details
-        async with httpx.AsyncClient() as client:
-            response = await client.get(
-                f"https://api.github.com/app/installations/{installation_id}",
-                headers={
-                    "Authorization": f"Bearer {jwt_token}",
-                    "Accept": "application/vnd.github.v3+json",
-                    "X-GitHub-Api-Version": "2022-11-28"
-                }
-            )
-            
-            if response.status_code != 200:
-                raise Exception(f"Failed to get installation: {response.text}")
-            
-            installation_data = response.json()
-            
-            # Get repositories
-            repos_response = await client.get(
-                f"https://api.github.com/installation/repositories",
-                headers={
-                    "Authorization": f"Bearer {installation_token}",
-                    "Accept": "application/vnd.github.v3+json",
-                    "X-GitHub-Api-Version": "2022-11-28"
-                }
-            )
-            
-            if repos_response.status_code == 200:
-                repos_data = repos_response.json()
-                installation_data["repositories"] = repos_data.get("repositories", [])
-            
-            return installation_data
+        response = await github_client.get(
+            f"/app/installations/{installation_id}",
+            headers={"Authorization": f"Bearer {jwt_token}"}
+        )
+        
+        if response.status_code != 200:
+            raise Exception(f"Failed to get installation: {response.text}")
+        
+        installation_data = orjson.loads(response.content)
+        
+        # Get repositories
+        repos_response = await github_client.get(
+            "/installation/repositories",
+            headers={"Authorization": f"Bearer {installation_token}"}
+        )
+        
+        if repos_response.status_code == 200:
+            repos_data = orjson.loads(repos_response.content)
+            installation_data["repositories"] = repos_data.get("repositories", [])
+            _installation_cache[str(installation_id)] = (time.monotonic() + INSTALLATION_CACHE_TTL, installation_data)
+        
+        return {**installation_data, "repositories": list(installation_data.get("repositories", []))}
             
     except Exception as e:
         logger.error(f"Error fetching installation details: {e}")
@@ -150,6 +206,22 @@ async def get_installation_details(installation_id: int) -> Dict[str, Any]:
         }
 
 
+async def delete_installation(installation_id: int) -> bool:
+    """Uninstall the GitHub App from an installation"""
+    try:
+        jwt_token = generate_jwt_token()
+        response = await github_client.delete(
+            f"/app/installations/{installation_id}",
+            headers={"Authorization": f"Bearer {jwt_token}"}
+        )
+        logger.info(f"Installation deletion response: {response.status_code}")
+        invalidate_installation_details(installation_id)
+        return response.status_code == 204
+    except Exception as e:
+        logger.error(f"Failed to delete installation {installation_id}: {e}")
+        return False
+
+
 async def create_github_issue(
     git_username: str, 
     repository_name: str, 
@@ -171,32 +243,27 @@ async def create_github_issue(
         access_token = await get_installation_token(installation_id, jwt_token)
         
         # Create the issue
-        async with httpx.AsyncClient() as client:
-            if len(body) > 60000:
-                body = body[:60000] + "\nMessage Truncated."
-
-            response = await client.post(
-                f"https://api.github.com/repos/{git_username}/{repository_name}/issues",
-                headers={
-                    "Authorization": f"token {access_token}",
-                    "Accept": "application/vnd.github.v3+json",
-                    "X-GitHub-Api-Version": "2022-11-28"
-                },
-                json={
-                    "title": title,
-                    "body": body
-                }
-            )
-            
-            if response.status_code == 201:
-                issue_data = response.json()
-                issue_url = issue_data.get("html_url")
-                logger.info(f"Successfully created GitHub issue: {issue_url}")
-                return issue_url
-            else:
-                logger.error(f"Failed to create GitHub issue: {response.status_code}")
-                logger.error(f"Response: {response.text}")
-                return None
+        if len(body) > 60000:
+            body = body[:60000] + "\nMessage Truncated."
+
+        response = await github_client.post(
+            f"/repos/{git_username}/{repository_name}/issues",
+            headers={"Authorization": f"token {access_token}", "Content-Type": "application/json"},
+            content=orjson.dumps({
+                "title": title,
+                "body": body
+            })
+        )
+        
+        if response.status_code == 201:
+            issue_data = orjson.loads(response.content)
+            issue_url = issue_data.get("html_url")
+            logger.info(f"Successfully created GitHub issue: {issue_url}")
+            return issue_url
+        else:
+            logger.error(f"Failed to create GitHub issue: {response.status_code}")
+            logger.error(f"Response: {response.text}")
+            return None
                 
     except Exception as e:
         logger.error(f"Error creating GitHub issue: {str(e)}")
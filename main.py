@@ -1,43 +1,94 @@
-from fastapi import FastAPI, Request, HTTPException, Form, Depends, Header
-from fastapi.responses import Response, HTMLResponse
-from pydantic import BaseModel, Field, field_validator
-import json
+from fastapi import FastAPI, Request, HTTPException, Form, Depends, Header, BackgroundTasks
+from fastapi.responses import Response, HTMLResponse, ORJSONResponse
+from fastapi.staticfiles import StaticFiles
+from fastapi.middleware.gzip import GZipMiddleware
+from pydantic import BaseModel, Field
+import orjson
+import asyncio
 import logging
-from typing import Dict, Any, List, Optional, Annotated
-from db.database import db_manager
-import generate_badge as sr
-import time
+import contextvars
+import uuid
+from typing import Dict, Any, List, Literal, Optional, Annotated
+from collections import OrderedDict
 import hashlib
-import httpx
+import time
+import hmac
 import os
 from datetime import datetime
 from dotenv import load_dotenv
-from github_api import generate_jwt_token, get_installation_token, get_installation_details, create_github_issue
+
+# Load .env before the local modules below read their settings at import time
+load_dotenv()
+
+from db.database import db_manager
+import generate_badge as sr
+from github_api import get_installation_details, create_github_issue, close_github_client, delete_installation
 from docker_ops import run_docker_container_async
 from webhook_handler import process_webhook_payload
 from badge_ops import add_badge_to_readme, add_badges_to_installation_repos
-from setup_ops import process_setup_save
-
-load_dotenv()
+from setup_ops import process_setup_save, templates, SETUP_TEMPLATE
 
 # API Secret for secure endpoints
 API_SECRET = os.getenv("API_SECRET", "your-default-secret-change-me")
+_API_SECRET_BYTES = API_SECRET.encode("utf-8")
+
+# Secret configured on the GitHub App webhook; deliveries must be signed with it
+GITHUB_WEBHOOK_SECRET = os.getenv("GITHUB_WEBHOOK_SECRET", "").encode("utf-8")
+# Development opt-out: accept unsigned webhooks when no secret is configured
+ALLOW_UNSIGNED_WEBHOOKS = os.getenv("ALLOW_UNSIGNED_WEBHOOKS", "false").lower() in ("1", "true", "yes")
+
+# Correlation id of the request being handled (GitHub's delivery id for webhooks); background tasks inherit it
+request_id_var = contextvars.ContextVar("request_id", default="-")
+
+class RequestIdFilter(logging.Filter):
+    """Expose the current request id to log formats as %(request_id)s"""
+    def filter(self, record):
+        record.request_id = request_id_var.get()
+        return True
 
 # Configure logging
-logging.basicConfig(level=logging.INFO)
+logging.basicConfig(level=logging.INFO, format="%(levelname)s:%(name)s:%(request_id)s:%(message)s")
+for handler in logging.getLogger().handlers:
+    handler.addFilter(RequestIdFilter())
 logger = logging.getLogger(__name__)
 
 app = FastAPI(
     title="Compiler Tester API",
     description="API for handling GitHub webhooks, badges, and authentication",
-    version="1.0.0"
+    version="1.0.0",
+    default_response_class=ORJSONResponse
 )
 
-app = FastAPI(
-    title="Compiler Tester API",
-    description="API for handling GitHub webhooks, badges, and authentication",
-    version="1.0.0"
-)
+class RequestIdMiddleware:
+    """Tag everything logged while serving a request with a short id"""
+    def __init__(self, app):
+        self.app = app
+    
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        delivery_id = dict(scope["headers"]).get(b"x-github-delivery")
+        token = request_id_var.set(delivery_id.decode("latin-1")[:8] if delivery_id else uuid.uuid4().hex[:8])
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            request_id_var.reset(token)
+
+app.add_middleware(RequestIdMiddleware)
+
+# HTML pages and badge SVGs compress well; small JSON bodies stay under the threshold and are sent as-is
+app.add_middleware(GZipMiddleware, minimum_size=500, compresslevel=6)
+
+class CachedStaticFiles(StaticFiles):
+    """StaticFiles that lets browsers keep assets (page stylesheets) for a day"""
+    def file_response(self, *args, **kwargs) -> Response:
+        response = super().file_response(*args, **kwargs)
+        response.headers["Cache-Control"] = "public, max-age=86400"
+        return response
+
+STATIC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "static")
+app.mount("/static", CachedStaticFiles(directory=STATIC_DIR), name="static")
 
 # Pydantic models for API endpoints
 class TestResultData(BaseModel):
@@ -45,15 +96,8 @@ class TestResultData(BaseModel):
     release_name: str = Field(..., description="Release/tag name")
     git_username: str = Field(..., description="GitHub username")
     repository_name: str = Field(..., description="Repository name")
-    test_status: str = Field(..., description="Test status: PASS, ERROR, or FAILED")
+    test_status: Literal["PASS", "ERROR", "FAILED"] = Field(..., description="Test status: PASS, ERROR, or FAILED")
     issue_text: Optional[str] = Field(None, description="Optional issue description for failed tests")
-    
-    @field_validator('test_status')
-    @classmethod
-    def validate_test_status(cls, v):
-        if v not in ['PASS', 'ERROR', 'FAILED']:
-            raise ValueError('test_status must be one of: PASS, ERROR, FAILED')
-        return v
 
 class TestResultResponse(BaseModel):
     success: bool
@@ -63,20 +107,44 @@ class TestResultResponse(BaseModel):
 # Security dependency
 async def verify_api_secret(x_api_secret: Annotated[str, Header()]) -> str:
     """Verify API secret from header"""
-    if x_api_secret != API_SECRET:
+    # Constant-time compare so response timing does not leak how much of the secret matched
+    if not hmac.compare_digest(x_api_secret.encode("utf-8"), _API_SECRET_BYTES):
         raise HTTPException(
             status_code=401,
             detail="Invalid API secret"
         )
     return x_api_secret
 
+def verify_webhook_signature(body: bytes, signature: str) -> bool:
+    """Check GitHub's X-Hub-Signature-256 header against the raw request body"""
+    if not GITHUB_WEBHOOK_SECRET:
+        # Fail closed: without a secret nothing can be verified
+        return ALLOW_UNSIGNED_WEBHOOKS
+    expected = "sha256=" + hmac.new(GITHUB_WEBHOOK_SECRET, body, hashlib.sha256).hexdigest()
+    # Compare bytes: compare_digest rejects str arguments with non-ASCII characters, which the header may carry
+    return hmac.compare_digest(signature.encode("utf-8"), expected.encode("ascii"))
+
+@app.on_event("startup")
+async def startup():
+    """Warn about configuration that leaves /webhook unprotected or unusable"""
+    if not GITHUB_WEBHOOK_SECRET:
+        if ALLOW_UNSIGNED_WEBHOOKS:
+            logger.warning("GITHUB_WEBHOOK_SECRET is not set and ALLOW_UNSIGNED_WEBHOOKS is on: /webhook accepts unsigned events")
+        else:
+            logger.warning("GITHUB_WEBHOOK_SECRET is not set: /webhook will reject every delivery")
+
+@app.on_event("shutdown")
+async def shutdown():
+    """Release pooled outbound connections"""
+    await close_github_client()
+
 @app.get("/")
 async def root():
     """Root endpoint"""
     return {"message": "Compiler Tester API is running"}
 
 @app.post("/webhook")
-async def webhook(request: Request):
+async def webhook(request: Request, background_tasks: BackgroundTasks):
     """
     Handle GitHub webhook events, specifically tag events
     """
@@ -87,44 +155,52 @@ async def webhook(request: Request):
         if not event_type:
             raise HTTPException(status_code=400, detail="Missing X-GitHub-Event header")
         
+        # Verify the signature on the raw bytes before parsing anything
+        body = await request.body()
+        if not verify_webhook_signature(body, request.headers.get("X-Hub-Signature-256", "")):
+            raise HTTPException(status_code=401, detail="Invalid webhook signature")
+        
         # Parse the JSON payload
-        payload = await request.json()
+        payload = orjson.loads(body)
         
         # Log the webhook event
-        logger.info(f"Received GitHub webhook: {event_type}")
+        logger.info("Received GitHub webhook: %s", event_type)
         
         # Process the webhook using our modular handler
-        return await process_webhook_payload(event_type, payload)
+        return await process_webhook_payload(event_type, payload, background_tasks)
         
-    except json.JSONDecodeError:
+    except orjson.JSONDecodeError:
         raise HTTPException(status_code=400, detail="Invalid JSON payload")
+    except HTTPException:
+        raise
     except Exception as e:
-        logger.error(f"Error processing webhook: {str(e)}")
+        logger.error("Error processing webhook: %s", e)
         raise HTTPException(status_code=500, detail="Internal server error")
 
 @app.post("/api/test-result", response_model=TestResultResponse)
 async def save_test_result(
     test_data: TestResultData,
     api_secret: str = Depends(verify_api_secret)
-) -> TestResultResponse:
+) -> ORJSONResponse:
     """
     Save a test result to the database.
     Requires a valid API secret in the X-API-Secret header.
     """
     try:
-        logger.info(f"Received test result for {test_data.git_username}/{test_data.repository_name}")
+        logger.info("Received test result for %s/%s", test_data.git_username, test_data.repository_name)
         
         # Verify that the repository exists
-        repo_info = db_manager.get_repository_info(test_data.git_username, test_data.repository_name)
+        repo_info = await asyncio.to_thread(db_manager.get_repository_info, test_data.git_username, test_data.repository_name)
         if not repo_info:
-            logger.warning(f"Repository {test_data.git_username}/{test_data.repository_name} not found")
+            logger.warning("Repository %s/%s not found", test_data.git_username, test_data.repository_name)
             raise HTTPException(
                 status_code=404, 
                 detail=f"Repository {test_data.git_username}/{test_data.repository_name} not found"
             )
         
         # Record the test result
-        success = db_manager.record_test_result(
+        success = await asyncio.to_thread(
+            db_manager.record_test_result,
             version_name=test_data.version_name,
             release_name=test_data.release_name,
             git_username=test_data.git_username,
@@ -135,7 +211,9 @@ async def save_test_result(
         )
         
         if success:
-            logger.info(f"Successfully recorded test result: {test_data.version_name}/{test_data.release_name} - {test_data.test_status}")
+            logger.info("Successfully recorded test result: %s/%s - %s", test_data.version_name, test_data.release_name, test_data.test_status)
+            # Re-render this repository's badge on its next request instead of waiting out the TTL
+            _svg_cache.pop((test_data.git_username, test_data.repository_name), None)
             
             # Create GitHub issue if test failed and there's issue text
             issue_url = None
@@ -150,24 +228,26 @@ async def save_test_result(
                         body=test_data.issue_text
                     )
                     if issue_url:
-                        logger.info(f"Created GitHub issue: {issue_url}")
+                        logger.info("Created GitHub issue: %s", issue_url)
                     else:
-                        logger.warning(f"Failed to create GitHub issue for {test_data.git_username}/{test_data.repository_name}")
+                        logger.warning("Failed to create GitHub issue for %s/%s", test_data.git_username, test_data.repository_name)
                 except Exception as issue_error:
-                    logger.error(f"Error creating GitHub issue: {str(issue_error)}")
+                    logger.error("Error creating GitHub issue: %s", issue_error)
                     # Don't fail the whole request if issue creation fails
             
             response_message = "Test result saved successfully"
             if issue_url:
                 response_message += f". GitHub issue created: {issue_url}"
             
-            return TestResultResponse(
-                success=True,
-                message=response_message,
-                issue_url=issue_url
-            )
+            # Returned as a response directly, so FastAPI skips re-validating and re-encoding it;
+            # response_model above still documents the shape
+            return ORJSONResponse({
+                "success": True,
+                "message": response_message,
+                "issue_url": issue_url
+            })
         else:
-            logger.error(f"Failed to record test result for {test_data.git_username}/{test_data.repository_name}")
+            logger.error("Failed to record test result for %s/%s", test_data.git_username, test_data.repository_name)
             raise HTTPException(
                 status_code=500,
                 detail="Failed to save test result to database"
@@ -177,163 +257,93 @@ async def save_test_result(
         # Re-raise HTTP exceptions
         raise
     except Exception as e:
-        logger.error(f"Unexpected error saving test result: {str(e)}")
+        logger.error("Unexpected error saving test result: %s", e)
         raise HTTPException(
             status_code=500,
             detail=f"Internal server error: {str(e)}"
         )
     
-@app.get('/svg/{user}/{repo}')
-async def svg(user, repo):
+# Rendered badges keyed by (user, repo) -> (checked until, status key, svg, etag); oldest entries evicted first
+SVG_CACHE_SIZE = 1024
+# Seconds a rendered badge is served without re-checking the database (also its public max-age)
+SVG_CACHE_TTL = 60
+_svg_cache = OrderedDict()
+
+def render_badge(user: str, repo: str) -> str:
+    """Build a repository's badge SVG (queries the database, so run it off the event loop)"""
     report = sr.RepoReport(git_username = user, repository_name = repo)
-    svg = report.compile()
+    return report.compile()
+
+@app.get('/svg/{user}/{repo}')
+async def svg(user, repo, request: Request):
+    now = time.monotonic()
+    cached = _svg_cache.get((user, repo))
+    if cached and cached[0] > now:
+        _svg_cache.move_to_end((user, repo))
+        _, _, svg, etag = cached
+    else:
+        status_key = await asyncio.to_thread(db_manager.get_repository_status_key, user, repo)
+        if cached and cached[1] == status_key:
+            svg, etag = cached[2], cached[3]
+        else:
+            svg = await asyncio.to_thread(render_badge, user, repo)
+            logger.info("Generated badge for %s/%s", user, repo)
+            # The ETag follows the badge content, so clients revalidate instead of refetching
+            etag = '"{}"'.format(hashlib.blake2b(svg.encode('utf-8'), digest_size=16).hexdigest())
+        _svg_cache[(user, repo)] = (now + SVG_CACHE_TTL, status_key, svg, etag)
+        _svg_cache.move_to_end((user, repo))
+        if len(_svg_cache) > SVG_CACHE_SIZE:
+            _svg_cache.popitem(last=False)
     #resp = Response(response=svg, status=200, mimetype="image/svg+xml")
-    logger.info(f"Generated badge for {user}/{repo}")
 
-    now = time.strftime("%Y %m %d %H %M")
-    txt = '{} {} {}'.format(user, repo, now).encode('utf-8')
-    etag = hashlib.sha1(txt).hexdigest()
+    headers = {
+        "Cache-Control": f"public, max-age={SVG_CACHE_TTL}",
+        "ETag": etag,
+    }
+    if request.headers.get("If-None-Match") == etag:
+        return Response(status_code=304, headers=headers)
         
     return Response(
         content=svg,
         media_type="image/svg+xml",
-        headers={
-            "Cache-Control": "no-cache, no-store, must-revalidate",
-            "Pragma": "no-cache",
-            "Expires": "0",
-            "ETag": etag,
-        }
+        headers=headers
     )
 
+# GitHub App installation page the login button points to
+# (OAuth alternative: https://github.com/login/oauth/authorize?client_id=...&redirect_uri=...&scope=read:user,repo)
+GITHUB_INSTALL_URL = "https://github.com/apps/compiler-tester/installations/new"
+
+# The login page has no per-request content, so it is rendered and encoded once at import
+LOGIN_HTML = templates.get_template("login.html").render(github_oauth_url=GITHUB_INSTALL_URL).encode("utf-8")
+LOGIN_HEADERS = {
+    "Cache-Control": "public, max-age=3600",
+    "ETag": '"{}"'.format(hashlib.blake2b(LOGIN_HTML, digest_size=16).hexdigest()),
+}
+
 @app.get("/login", response_class=HTMLResponse)
 async def login_page(request: Request):
     """
     GitHub App login landing page
     """
-    # GitHub App configuration (you'll need to replace these with your actual values)
-    github_app_client_id = "1578480"  # Replace with your GitHub App client ID
-    redirect_uri = "https://compiler-tester.insper-comp.com.br/auth/callback"  # Replace with your callback URL
+    # The page is static, so let browsers and proxies keep it and revalidate it cheaply
+    if request.headers.get("If-None-Match") == LOGIN_HEADERS["ETag"]:
+        return Response(status_code=304, headers=LOGIN_HEADERS)
     
-    # Scopes needed for your app
-    scopes = "read:user,repo"
-    
-    # GitHub OAuth URL
-    #github_oauth_url = f"https://github.com/login/oauth/authorize?client_id={github_app_client_id}&redirect_uri={redirect_uri}&scope={scopes}&state=random_state_string"
-    github_oauth_url = f"https://github.com/apps/compiler-tester/installations/new"
-    
-    html_content = f"""
-    <!DOCTYPE html>
-    <html lang="en">
-    <head>
-        <meta charset="UTF-8">
-        <meta name="viewport" content="width=device-width, initial-scale=1.0">
-        <title>Compiler Tester - GitHub Login</title>
-        <style>
-            body {{
-                font-family: -apple-system, BlinkMacSystemFont, 'Segoe UI', Helvetica, Arial, sans-serif;
-                margin: 0;
-                padding: 0;
-                background-color: #f6f8fa;
-                display: flex;
-                justify-content: center;
-                align-items: center;
-                min-height: 100vh;
-            }}
-            .container {{
-                background: white;
-                padding: 40px;
-                border-radius: 12px;
-                box-shadow: 0 8px 24px rgba(140, 149, 159, 0.2);
-                text-align: center;
-                max-width: 400px;
-                width: 100%;
-            }}
-            .logo {{
-                width: 80px;
-                height: 80px;
-                background: #24292e;
-                border-radius: 50%;
-                margin: 0 auto 20px;
-                display: flex;
-                align-items: center;
-                justify-content: center;
-                color: white;
-                font-size: 24px;
-                font-weight: bold;
-            }}
-            h1 {{
-                color: #24292e;
-                margin-bottom: 10px;
-                font-size: 24px;
-            }}
-            p {{
-                color: #586069;
-                margin-bottom: 30px;
-                line-height: 1.5;
-            }}
-            .login-btn {{
-                background-color: #24292e;
-                color: white;
-                padding: 12px 24px;
-                border: none;
-                border-radius: 6px;
-                font-size: 16px;
-                text-decoration: none;
-                display: inline-block;
-                transition: background-color 0.2s;
-                cursor: pointer;
-            }}
-            .login-btn:hover {{
-                background-color: #1b1f23;
-            }}
-            .features {{
-                margin-top: 30px;
-                text-align: left;
-            }}
-            .feature {{
-                margin-bottom: 10px;
-                color: #586069;
-            }}
-            .feature::before {{
-                content: "✓";
-                color: #28a745;
-                font-weight: bold;
-                margin-right: 8px;
-            }}
-        </style>
-    </head>
-    <body>
-        <div class="container">
-            <div class="logo">CT</div>
-            <h1>Compiler Tester</h1>
-            <p>Connect your GitHub repositories to automatically test compilation on new releases.</p>
-            
-            <a href="{github_oauth_url}" class="login-btn">
-                Login with GitHub
-            </a>
-            
-            <div class="features">
-                <div class="feature">Automatic compilation testing on tag creation</div>
-                <div class="feature">Real-time build status badges</div>
-                <div class="feature">GitHub webhook integration</div>
-                <div class="feature">Secure GitHub App authentication</div>
-            </div>
-        </div>
-    </body>
-    </html>
-    """
-    
-    return HTMLResponse(content=html_content)
+    return Response(
+        content=LOGIN_HTML,
+        media_type="text/html",
+        headers=LOGIN_HEADERS
+    )
 
 @app.get("/setup")
-async def setup_callback(installation_id: int = None, setup_action: str = None):
+async def setup_callback(request: Request, installation_id: int = None, setup_action: str = None):
     """
     Handle GitHub App installation setup callback
     """
     if not installation_id:
         raise HTTPException(status_code=400, detail="Missing installation_id")
     
-    logger.info(f"App installed with installation_id: {installation_id}, action: {setup_action}")
+    logger.info("App installed with installation_id: %s, action: %s", installation_id, setup_action)
     
     # Get installation details from GitHub API
     try:
@@ -346,432 +356,40 @@ async def setup_callback(installation_id: int = None, setup_action: str = None):
         if len(repositories) != 1:
             # Show a HTML page to user that only single repository installations are supported
             # Remove the installation using the token
-            try:
-                jwt_token = generate_jwt_token()
-                async with httpx.AsyncClient() as client:
-                    delete_response = await client.delete(
-                        f"https://api.github.com/app/installations/{installation_id}",
-                        headers={
-                            "Authorization": f"Bearer {jwt_token}",
-                            "Accept": "application/vnd.github.v3+json",
-                            "X-GitHub-Api-Version": "2022-11-28"
-                        }
-                    )
-                    logger.info(f"Installation deletion response: {delete_response.status_code}")
-            except Exception as e:
-                logger.error(f"Failed to delete installation {installation_id}: {e}")
+            await delete_installation(installation_id)
             
             # Return HTML page explaining the restriction
-            html_content = f"""
-            <!DOCTYPE html>
-            <html lang="en">
-            <head>
-                <meta charset="UTF-8">
-                <meta name="viewport" content="width=device-width, initial-scale=1.0">
-                <title>Installation Error - Compiler Tester</title>
-                <style>
-                    body {{
-                        font-family: -apple-system, BlinkMacSystemFont, 'Segoe UI', Helvetica, Arial, sans-serif;
-                        margin: 0;
-                        padding: 0;
-                        background-color: #f6f8fa;
-                        display: flex;
-                        justify-content: center;
-                        align-items: center;
-                        min-height: 100vh;
-                    }}
-                    .container {{
-                        background: white;
-                        padding: 40px;
-                        border-radius: 12px;
-                        box-shadow: 0 8px 24px rgba(140, 149, 159, 0.2);
-                        text-align: center;
-                        max-width: 500px;
-                        width: 100%;
-                    }}
-                    .error-icon {{
-                        width: 80px;
-                        height: 80px;
-                        background: #dc3545;
-                        border-radius: 50%;
-                        margin: 0 auto 20px;
-                        display: flex;
-                        align-items: center;
-                        justify-content: center;
-                        color: white;
-                        font-size: 32px;
-                        font-weight: bold;
-                    }}
-                    h1 {{
-                        color: #dc3545;
-                        margin-bottom: 10px;
-                        font-size: 24px;
-                    }}
-                    p {{
-                        color: #586069;
-                        margin-bottom: 20px;
-                        line-height: 1.5;
-                    }}
-                    .warning-box {{
-                        background-color: #fff3cd;
-                        border: 1px solid #ffeaa7;
-                        border-radius: 8px;
-                        padding: 20px;
-                        margin: 20px 0;
-                        text-align: left;
-                    }}
-                    .warning-box h3 {{
-                        color: #856404;
-                        margin-top: 0;
-                        margin-bottom: 10px;
-                    }}
-                    .warning-box p {{
-                        color: #856404;
-                        margin-bottom: 0;
-                    }}
-                    .btn {{
-                        background-color: #2da44e;
-                        color: white;
-                        padding: 12px 24px;
-                        border: none;
-                        border-radius: 6px;
-                        font-size: 16px;
-                        text-decoration: none;
-                        display: inline-block;
-                        margin: 10px;
-                        cursor: pointer;
-                        transition: background-color 0.2s;
-                    }}
-                    .btn:hover {{
-                        background-color: #2c974b;
-                    }}
-                    .btn-secondary {{
-                        background-color: #6c757d;
-                    }}
-                    .btn-secondary:hover {{
-                        background-color: #5a6268;
-                    }}
-                    .steps {{
-                        text-align: left;
-                        margin: 20px 0;
-                    }}
-                    .step {{
-                        margin: 10px 0;
-                        padding: 10px 0;
-                    }}
-                    .step-number {{
-                        background-color: #0366d6;
-                        color: white;
-                        border-radius: 50%;
-                        width: 24px;
-                        height: 24px;
-                        display: inline-flex;
-                        align-items: center;
-                        justify-content: center;
-                        font-size: 14px;
-                        font-weight: bold;
-                        margin-right: 10px;
-                    }}
-                </style>
-            </head>
-            <body>
-                <div class="container">
-                    <div class="error-icon">⚠️</div>
-                    <h1>Installation Not Allowed</h1>
-                    <p>We detected that you tried to install the Compiler Tester app on <strong>{len(repositories)} repositories</strong>.</p>
-                    
-                    <div class="warning-box">
-                        <h3>⚠️ Single Repository Policy</h3>
-                        <p>For optimal performance and focused testing, Compiler Tester only supports installations on <strong>exactly one repository at a time</strong>.</p>
-                    </div>
-                    
-                    <div class="steps">
-                        <h3>How to Install Correctly:</h3>
-                        <div class="step">
-                            <span class="step-number">1</span>
-                            Click "Try Again" below to return to the login page
-                        </div>
-                        <div class="step">
-                            <span class="step-number">2</span>
-                            Choose <strong>"Only select repositories"</strong> (not "All repositories")
-                        </div>
-                        <div class="step">
-                            <span class="step-number">3</span>
-                            Select <strong>only ONE repository</strong> that you want to monitor
-                        </div>
-                        <div class="step">
-                            <span class="step-number">4</span>
-                            Complete the installation
-                        </div>
-                    </div>
-                    
-                    <p><strong>Why only one repository?</strong></p>
-                    <ul style="text-align: left; color: #586069;">
-                        <li>Better performance and faster compilation testing</li>
-                        <li>Focused monitoring for specific projects</li>
-                        <li>Easier management and debugging</li>
-                        <li>More efficient resource usage</li>
-                    </ul>
-                    
-                    <div style="margin-top: 30px;">
-                        <a href="/login" class="btn">🔄 Try Again</a>
-                        <a href="https://github.com/settings/installations" class="btn btn-secondary">⚙️ Manage Installations</a>
-                    </div>
-                    
-                    <p style="margin-top: 20px; color: #656d76; font-size: 14px;">
-                        The installation has been automatically removed. You can install the app again following the single repository guidelines.
-                    </p>
-                </div>
-            </body>
-            </html>
-            """
-            
-            return HTMLResponse(content=html_content, status_code=400)
+            return templates.TemplateResponse(
+                "install_error.html",
+                {"request": request, "repo_count": len(repositories)},
+                status_code=400
+            )
 
 
-        # Save each repository with installation_id and empty values for other fields
+        # Split each "owner/name" once; the pieces feed both the database rows and the form
+        repo_forms = []
         for repo in repositories:
             repo_full_name = repo.get("full_name", "")
-            if "/" in repo_full_name:
-                git_username, repository_name = repo_full_name.split("/", 1)
-                db_manager.save_repository_with_installation(git_username, repository_name, installation_id)
+            git_username, sep, repository_name = repo_full_name.partition("/")
+            if sep:
+                repo_forms.append({
+                    "full_name": repo_full_name,
+                    "git_username": git_username,
+                    "repository_name": repository_name
+                })
         
-        # Generate repository form sections
-        repo_forms = ""
-        for repo in repositories:
-            repo_full_name = repo.get("full_name", "")
-            if "/" in repo_full_name:
-                git_username, repository_name = repo_full_name.split("/", 1)
-                repo_forms += f"""
-                <div class="repo-section">
-                    <h3>Repository: {repo_full_name}</h3>
-                    <input type="hidden" name="git_username[]" value="{git_username}">
-                    <input type="hidden" name="repository_name[]" value="{repository_name}">
-                    
-                    <div class="form-group">
-                        <label>Git Username:</label>
-                        <input type="text" value="{git_username}" readonly class="readonly-field">
-                    </div>
-                    
-                    <div class="form-group">
-                        <label>Git Repository:</label>
-                        <input type="text" value="{repository_name}" readonly class="readonly-field">
-                    </div>
-                    
-                    <div class="form-group">
-                        <label for="email_{repository_name}">Insper E-mail:</label>
-                        <input type="email" name="email[]" id="email_{repository_name}" 
-                               pattern=".*@al[.]insper[.]edu[.]br$" 
-                               placeholder="your.name@al.insper.edu.br" required>
-                        <small style="color: #656d76;">Must be an @al.insper.edu.br email</small>
-                    </div>
-                    
-                    <div class="form-group">
-                        <label for="name_{repository_name}">Name:</label>
-                        <input type="text" name="name[]" id="name_{repository_name}" 
-                               placeholder="Your full name" required>
-                    </div>
-                    
-                    <div class="form-group">
-                        <label>Course:</label>
-                        <div class="radio-group">
-                            <label class="radio-label">
-                                <input type="radio" name="course_{repository_name}" value="CieComp" required>
-                                CieComp
-                            </label>
-                            <label class="radio-label">
-                                <input type="radio" name="course_{repository_name}" value="EngComp" required>
-                                EngComp
-                            </label>
-                        </div>
-                    </div>
-                    
-                    <div class="form-group">
-                        <label for="language_{repository_name}">Language:</label>
-                        <select name="language[]" id="language_{repository_name}" required>
-                            <option value="Python" selected>Python</option>
-                            <option value="JavaScript">JavaScript</option>
-                            <option value="TypeScript">TypeScript</option>
-                            <option value="C++">C++</option>
-                            <option value="OCaml">OCaml</option>
-                            <option value="Kotlin">Kotlin</option>
-                            <option value="Go">Go</option>
-                            <option value="C#">C#</option>
-                            <option value="PHP">PHP</option>
-                            <option value="Swift">Swift</option>
-                            <option value="Rust">Rust</option>
-                            <option value="Zig">Zig</option>
-                            <option value="Lua">Lua</option>
-                        </select>
-                    </div>
-                </div>
-                """
+        # Save all repositories with installation_id and empty values for other fields
+        rows = [(repo["git_username"], repo["repository_name"], installation_id) for repo in repo_forms]
+        await asyncio.to_thread(db_manager.save_repositories_with_installation, rows)
+        
+        # Render in full here so a template error also takes the 500 path below
+        page = SETUP_TEMPLATE.render(installation_id=installation_id, repositories=repo_forms)
         
     except Exception as e:
-        logger.error(f"Error in setup: {e}")
+        logger.error("Error in setup: %s", e)
         raise HTTPException(status_code=500, detail="Setup failed")
     
-    html_content = f"""
-    <!DOCTYPE html>
-    <html lang="en">
-    <head>
-        <meta charset="UTF-8">
-        <meta name="viewport" content="width=device-width, initial-scale=1.0">
-        <title>Compiler Tester - Setup</title>
-        <style>
-            body {{
-                font-family: -apple-system, BlinkMacSystemFont, 'Segoe UI', Helvetica, Arial, sans-serif;
-                margin: 0;
-                padding: 20px;
-                background-color: #f6f8fa;
-            }}
-            .container {{
-                max-width: 800px;
-                margin: 0 auto;
-                background: white;
-                padding: 40px;
-                border-radius: 12px;
-                box-shadow: 0 8px 24px rgba(140, 149, 159, 0.2);
-            }}
-            h1 {{
-                color: #24292e;
-                margin-bottom: 20px;
-            }}
-            h3 {{
-                color: #0366d6;
-                margin-top: 30px;
-                margin-bottom: 15px;
-                padding-bottom: 8px;
-                border-bottom: 2px solid #e1e4e8;
-            }}
-            .form-group {{
-                margin-bottom: 15px;
-            }}
-            label {{
-                display: block;
-                margin-bottom: 5px;
-                font-weight: 600;
-                color: #24292e;
-            }}
-            input, select {{
-                width: 100%;
-                padding: 8px 12px;
-                border: 1px solid #d0d7de;
-                border-radius: 6px;
-                font-size: 14px;
-                box-sizing: border-box;
-            }}
-            .readonly-field {{
-                background-color: #f6f8fa;
-                color: #656d76;
-            }}
-            .radio-group {{
-                display: flex;
-                gap: 20px;
-            }}
-            .radio-label {{
-                display: flex;
-                align-items: center;
-                gap: 5px;
-                font-weight: normal;
-            }}
-            .radio-label input[type="radio"] {{
-                width: auto;
-                margin: 0;
-            }}
-            .checkbox-label {{
-                display: flex;
-                align-items: center;
-                gap: 8px;
-                font-weight: normal;
-                cursor: pointer;
-            }}
-            .checkbox-label input[type="checkbox"] {{
-                width: auto;
-                margin: 0;
-            }}
-            .global-options {{
-                background-color: #f0f8ff;
-                border: 1px solid #b8daff;
-                border-radius: 8px;
-                padding: 20px;
-                margin-bottom: 30px;
-            }}
-            .submit-btn {{
-                background-color: #2da44e;
-                color: white;
-                padding: 12px 24px;
-                border: none;
-                border-radius: 6px;
-                font-size: 16px;
-                cursor: pointer;
-                margin-top: 20px;
-            }}
-            .submit-btn:hover {{
-                background-color: #2c974b;
-            }}
-            .repo-section {{
-                border: 1px solid #e1e4e8;
-                border-radius: 8px;
-                padding: 20px;
-                margin-bottom: 20px;
-                background-color: #fafbfc;
-            }}
-            small {{
-                display: block;
-                margin-top: 3px;
-            }}
-        </style>
-    </head>
-    <body>
-        <div class="container">
-            <h1>🎉 App Installed Successfully!</h1>
-            <p>Please complete the setup for each repository:</p>
-            
-            <form action="/setup/save" method="post">
-                <input type="hidden" name="installation_id" value="{installation_id}">
-                
-                <div class="global-options">
-                    <h3>Global Options</h3>
-                    <div class="form-group">
-                        <label class="checkbox-label">
-                            <input type="checkbox" name="add_badges" value="true" checked>
-                            Automatically add compilation status badges to README.md files
-                        </label>
-                        <small style="color: #656d76;">This will add a badge showing compilation status at the top of each repository's README.md</small>
-                    </div>
-                </div>
-                
-                {repo_forms}
-                
-                <button type="submit" class="submit-btn">Save All Repositories</button>
-            </form>
-        </div>
-    </body>
-    </html>
-    """
-    
-    return HTMLResponse(content=html_content)
-
-async def get_installation_id_for_repo(repo_full_name: str) -> Optional[int]:
-    """
-    Find installation ID for a given repository
-    """
-    try:
-        with db_manager.get_connection() as conn:
-            cursor = conn.cursor()
-            cursor.execute("""
-                SELECT installation_id 
-                FROM InstallationRepository 
-                WHERE repository_full_name = ?
-            """, (repo_full_name,))
-            
-            row = cursor.fetchone()
-            return row[0] if row else None
-            
-    except Exception as e:
-        logger.error(f"Error finding installation for repo {repo_full_name}: {e}")
-        return None
+    return HTMLResponse(page)
 
 @app.post("/setup/save")
 async def save_setup(request: Request):
@@ -798,7 +416,7 @@ async def auth_callback(code: str = None, state: str = None, error: str = None):
     # 3. Store the token securely
     # 4. Create a session or JWT
     
-    logger.info(f"Received auth callback with code: {code[:10]}...")
+    logger.info("Received auth callback with code: %s...", code[:10])
     
     return {
         "message": "Authentication successful",
@@ -807,7 +425,10 @@ async def auth_callback(code: str = None, state: str = None, error: str = None):
 
 if __name__ == "__main__":
     import uvicorn
+    # Pin uvloop/httptools (shipped with uvicorn[standard]); extra worker processes are opt-in
+    # because the badge, installation and lookup caches live in each process
     uvicorn.run("main:app", host="0.0.0.0", port=443, reload=False, log_level="info", access_log=True,
+    workers=int(os.getenv("WEB_CONCURRENCY", "1")), loop="uvloop", http="httptools",
     ssl_certfile="/etc/letsencrypt/live/compiler-tester.insper-comp.com.br/fullchain.pem",
     ssl_keyfile="/etc/letsencrypt/live/compiler-tester.insper-comp.com.br/privkey.pem"
     )
@@ -3,35 +3,114 @@ Setup operations module for GitHub App installation setup
 """
 
 import os
+import asyncio
 import logging
-from datetime import datetime
+from datetime import date
+from functools import lru_cache
+from typing import Literal
+from pydantic import BaseModel, Field, ValidationError
 from fastapi import HTTPException, Request, Form
 from fastapi.responses import HTMLResponse
+from fastapi.templating import Jinja2Templates
 from github_api import get_installation_details
 from badge_ops import add_badges_to_installation_repos
 from db.database import db_manager
 
 logger = logging.getLogger(__name__)
 
+# Jinja compiles each template once and keeps it in its cache between requests
+TEMPLATES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "templates")
+templates = Jinja2Templates(directory=TEMPLATES_DIR)
+SETUP_TEMPLATE = templates.get_template("setup.html")
+SETUP_SUCCESS_TEMPLATE = templates.get_template("setup_success.html")
 
-def get_current_semester() -> str:
-    """Get current semester based on current month"""
-    month = datetime.now().month
-    if month in [1, 2, 3, 4, 5, 6]:
-        return "1"
-    elif month in [7, 8, 9, 10, 11, 12]:
-        return "2"
-    else:
-        return "unknown"
+# Public URL of this service, used in README badge links
+BASE_URL = os.getenv("BASE_URL")
 
+# Server-side check matching the pattern= attribute on the setup form's e-mail field
+EMAIL_PATTERN = r"^[^@\s]+@al\.insper\.edu\.br$"
 
-async def process_setup_save(request: Request):
+# Semester prefix per course radio button value
+SEMESTER_PREFIX = {"EngComp": "ENG", "CieComp": "BCC"}
+
+# Semester number indexed by month (index 0 unused): January-June is "1", July-December is "2"
+MONTH_TO_SEMESTER = (None, "1", "1", "1", "1", "1", "1", "2", "2", "2", "2", "2", "2")
+
+# Command used to run the compiler for each language
+PROGRAM_CALL_MAP = {
+    "Python": "python3 main.py",
+    "JavaScript": "node main.js", 
+    "TypeScript": 'ts-node --skip-project --transpile-only --compiler-options \'{"module":"commonjs"}\' main.ts',
+    "Go": "go run main.go",
+    "OCaml": "ocaml main.ml",
+    "Kotlin": "kotlinc -script main.kts",
+    "C++": "g++ main.cpp -o main && ./main",
+    "C#": "dotnet run main.csproj",
+    "PHP": "php main.php",
+    "Rust": "cargo run --release",
+    "Swift": "swift main.swift",
+    "Zig": "zig run main.zig --",
+    "Lua": "lua main.lua"
+}
+
+# Languages whose submissions are compiled before running
+COMPILED_LANGS = frozenset({"Java", "C++", "C#"})
+
+
+class SetupRow(BaseModel):
+    """One repository block of the setup form"""
+    git_username: str
+    repository_name: str
+    course: Literal["EngComp", "CieComp"]
+    email: str = Field(..., pattern=EMAIL_PATTERN)
+    name: str
+    language: str
+
+
+def describe_setup_error(error: ValidationError, course) -> str:
+    """Turn the first validation error of a SetupRow into the short reason shown on the success page"""
+    field = error.errors()[0]["loc"][0]
+    if field == "course":
+        return "Missing course" if not course else "Invalid course"
+    if field == "email":
+        return "Invalid e-mail"
+    return f"Invalid {field}"
+
+
+@lru_cache(maxsize=4)
+def semester_for_date(day: date) -> str:
+    """Year-semester string for a date (e.g. "2025-2"), cached per day"""
+    return f"{day.year}-{MONTH_TO_SEMESTER[day.month]}"
+
+
+def save_setup_rows(user_rows: list, repo_rows: list):
     """
-    Process the setup form submission and save repository configurations
+    Save users and repository details in a single transaction (one commit for the whole form).
+    Only rows whose repository was registered by the setup callback are written.
+    Returns the set of registered (git_username, repository_name) keys,
+    or None if the batch failed and was rolled back.
+    """
+    try:
+        with db_manager.transaction() as conn:
+            keys = db_manager.get_repository_keys({row[0] for row in user_rows}, conn=conn)
+            # user_rows and repo_rows are built pairwise; skip users of unregistered repositories
+            registered = [(user, repo) for user, repo in zip(user_rows, repo_rows) if (repo[4], repo[5]) in keys]
+            saved = (db_manager.save_or_update_users([user for user, _ in registered], conn=conn)
+                     and db_manager.update_repositories_details([repo for _, repo in registered], conn=conn))
+            if not saved:
+                # Raising lets transaction() roll the whole batch back
+                raise Exception("Saving users or repository details failed")
+            return keys
+    except Exception as e:
+        logger.error(f"Error saving setup rows: {e}")
+        return None
+
+
+def validate_setup_form(form_data, current_semester: str):
+    """
+    Validate every repository block of the setup form without touching the database.
+    Returns (user_rows, repo_rows, failed_repos) ready for save_setup_rows.
     """
-    form_data = await request.form()
-    installation_id = form_data.get("installation_id")
-    
     # Get arrays of form data
     git_usernames = form_data.getlist("git_username[]")
     repository_names = form_data.getlist("repository_name[]") 
@@ -39,94 +118,94 @@ async def process_setup_save(request: Request):
     names = form_data.getlist("name[]")
     languages = form_data.getlist("language[]")
     
+    if not (len(git_usernames) == len(repository_names) == len(emails) == len(names) == len(languages)):
+        raise HTTPException(status_code=400, detail="Malformed setup form")
+    
+    user_rows = []
+    repo_rows = []
+    failed_repos = []
+    
+    for git_username, repository_name, email, name, language in zip(
+        git_usernames, repository_names, emails, names, languages
+    ):
+        # Get course from radio button (different name for each repo)
+        course = form_data.get(f"course_{repository_name}")
+        
+        try:
+            row = SetupRow(
+                git_username=git_username, repository_name=repository_name,
+                course=course, email=email, name=name, language=language
+            )
+        except ValidationError as e:
+            failed_repos.append(f"{git_username}/{repository_name} - {describe_setup_error(e, course)}")
+            continue
+        
+        # Generate semester name based on course
+        semester_name = f"{SEMESTER_PREFIX[row.course]}-{current_semester}"
+        
+        # Generate program_call based on language
+        compiled = 1 if row.language in COMPILED_LANGS else 0
+        program_call = PROGRAM_CALL_MAP.get(row.language, "")
+        
+        user_rows.append((row.git_username, row.name, row.email))
+        repo_rows.append((semester_name, program_call, compiled, row.language, row.git_username, row.repository_name))
+    
+    return user_rows, repo_rows, failed_repos
+
+
+async def process_setup_save(request: Request):
+    """
+    Process the setup form submission and save repository configurations
+    """
+    form_data = await request.form()
+    installation_id = form_data.get("installation_id")
+    
     logger.info(f"Saving setup for installation {installation_id}")
     
+    current_semester = semester_for_date(date.today())
+    
+    # Phase 1: validate the whole form before any write
+    user_rows, repo_rows, failed_repos = validate_setup_form(form_data, current_semester)
+    
+    add_badges = form_data.get("add_badges") == "true"
+    
+    installation_task = None
     try:
-        current_semester = datetime.now().strftime("%Y") + '-' + get_current_semester()
+        # Fetch the installation's repositories from GitHub while the rows are being written
+        if add_badges and repo_rows:
+            installation_task = asyncio.create_task(get_installation_details(installation_id))
         
         success_repos = []
-        failed_repos = []
         
-        for i in range(len(git_usernames)):
-            git_username = git_usernames[i]
-            repository_name = repository_names[i]
-            email = emails[i]
-            name = names[i]
-            language = languages[i]
+        # Phase 2: write all valid rows in one transaction
+        if repo_rows:
+            # sqlite3 calls block, so run them on a worker thread to keep the event loop serving requests
+            saved_keys = await asyncio.to_thread(save_setup_rows, user_rows, repo_rows)
             
-            # Get course from radio button (different name for each repo)
-            course_key = f"course_{repository_name}"
-            course = form_data.get(course_key)
-            
-            if not course:
-                failed_repos.append(f"{git_username}/{repository_name} - Missing course")
-                continue
-            
-            # Generate semester name based on course
-            if course == "EngComp":
-                semester_name = f"ENG-{current_semester}"
-            elif course == "CieComp":
-                semester_name = f"BCC-{current_semester}"
+            if saved_keys is None:
+                failed_repos.extend(f"{u}/{r} - Database error" for *_, u, r in repo_rows)
             else:
-                failed_repos.append(f"{git_username}/{repository_name} - Invalid course")
-                continue
-            
-            # Generate program_call based on language
-            compiled = 0
-            program_call_map = {
-                "Python": "python3 main.py",
-                "JavaScript": "node main.js", 
-                "TypeScript": 'ts-node --skip-project --transpile-only --compiler-options \'{"module":"commonjs"}\' main.ts',
-                "Go": "go run main.go",
-                "OCaml": "ocaml main.ml",
-                "Kotlin": "kotlinc -script main.kts",
-                "C++": "g++ main.cpp -o main && ./main",
-                "C#": "dotnet run main.csproj",
-                "PHP": "php main.php",
-                "Rust": "cargo run --release",
-                "Swift": "swift main.swift",
-                "Zig": "zig run main.zig --",
-                "Lua": "lua main.lua"
-            }
-            program_call = program_call_map.get(language, "")
-            if language in ["Java", "C++", "C#"]:
-                compiled = 1
-            
-            # Save/update user
-            user_success = db_manager.save_or_update_user(git_username, name, email)
-            
-            # Update repository with complete details
-            repo_success = db_manager.update_repository_details(
-                git_username, repository_name, semester_name, program_call, language, compiled
-            )
-            
-            if user_success and repo_success:
-                success_repos.append(f"{git_username}/{repository_name}")
-            else:
-                failed_repos.append(f"{git_username}/{repository_name} - Database error")
+                # An UPDATE silently matches nothing for repositories the setup callback never registered
+                success_repos.extend(f"{u}/{r}" for *_, u, r in repo_rows if (u, r) in saved_keys)
+                failed_repos.extend(f"{u}/{r} - Repository not registered" for *_, u, r in repo_rows if (u, r) not in saved_keys)
         
         # Handle badge addition if requested
-        add_badges = form_data.get("add_badges") == "true"
         badge_results = {}
         
-        if add_badges and success_repos:
+        if installation_task and success_repos:
             logger.info("Adding badges to repositories...")
             
             try:
                 # Get installation details to get repository list with permissions
-                installation_data = await get_installation_details(installation_id)
+                installation_data = await installation_task
                 repositories = installation_data.get("repositories", [])
                 
-                # Filter to only successful repositories
-                successful_repo_names = set(success_repos)
-                repos_to_badge = [
-                    repo for repo in repositories 
-                    if repo.get("full_name") in successful_repo_names
-                ]
+                # Filter to only successful repositories, in the order they were saved
+                repo_by_name = {repo.get("full_name"): repo for repo in repositories}
+                repos_to_badge = [repo_by_name[name] for name in success_repos if name in repo_by_name]
                 
                 # Add badges
-                base_url = os.getenv("BASE_URL")
-                badge_results = await add_badges_to_installation_repos(installation_id, repos_to_badge, base_url)
+                badge_results = await add_badges_to_installation_repos(installation_id, repos_to_badge, BASE_URL)
                 
                 # Update success/failed lists based on badge results
                 for repo_name, badge_success in badge_results.items():
@@ -143,6 +222,11 @@ async def process_setup_save(request: Request):
     except Exception as e:
         logger.error(f"Error saving setup: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Setup failed: {str(e)}")
+    
+    finally:
+        # Not awaited when nothing was saved or the handler failed early; don't leave it running
+        if installation_task and not installation_task.done():
+            installation_task.cancel()
 
 
 def generate_setup_success_page(
@@ -153,112 +237,16 @@ def generate_setup_success_page(
 ) -> HTMLResponse:
     """Generate HTML success page for setup completion"""
     
-    # Generate success list
-    if success_repos:
-        success_list = "<br>".join([f"✅ {repo}" for repo in success_repos])
-    else:
-        success_list = "No repositories were successfully configured."
-        
-    if failed_repos:
-        failure_list = "<br>".join([f"❌ {repo}" for repo in failed_repos])
-    else:
-        failure_list = ""
-    
-    # Generate badge status message
-    badge_message = ""
-    if add_badges:
-        successful_badges = sum(1 for success in badge_results.values() if success)
-        total_badges = len(badge_results)
-        
-        if total_badges > 0:
-            badge_message = f"<br><br><strong>Badge Addition:</strong> {successful_badges}/{total_badges} badges added successfully"
-            if successful_badges < total_badges:
-                failed_badge_repos = [repo for repo, success in badge_results.items() if not success]
-                badge_message += f"<br>Failed to add badges to: {', '.join(failed_badge_repos)}"
-        else:
-            badge_message = "<br><br><strong>Badge Addition:</strong> No badges were processed"
-    
-    success_html = f"""
-    <!DOCTYPE html>
-    <html lang="en">
-    <head>
-        <meta charset="UTF-8">
-        <meta name="viewport" content="width=device-width, initial-scale=1.0">
-        <title>Setup Complete</title>
-        <style>
-            body {{
-                font-family: -apple-system, BlinkMacSystemFont, 'Segoe UI', Helvetica, Arial, sans-serif;
-                margin: 0;
-                padding: 20px;
-                background-color: #f6f8fa;
-            }}
-            .container {{
-                max-width: 600px;
-                margin: 0 auto;
-                background: white;
-                padding: 40px;
-                border-radius: 12px;
-                box-shadow: 0 8px 24px rgba(140, 149, 159, 0.2);
-                text-align: center;
-            }}
-            .success {{
-                color: #2da44e;
-                font-size: 48px;
-                margin-bottom: 20px;
-            }}
-            h1 {{
-                color: #24292e;
-                margin-bottom: 20px;
-            }}
-            .info {{
-                background-color: #f6f8fa;
-                padding: 20px;
-                border-radius: 6px;
-                margin: 20px 0;
-                text-align: left;
-            }}
-            .repo-link {{
-                display: inline-block;
-                margin: 10px;
-                padding: 8px 16px;
-                background-color: #0366d6;
-                color: white;
-                text-decoration: none;
-                border-radius: 6px;
-                font-size: 14px;
-            }}
-            .repo-link:hover {{
-                background-color: #0256cc;
-            }}
-        </style>
-    </head>
-    <body>
-        <div class="container">
-            <div class="success">✅</div>
-            <h1>Setup Complete!</h1>
-            <p>Your repositories have been configured for automatic compilation testing.</p>
-            
-            <div class="info">
-                <strong>Successfully Configured:</strong><br>
-                {success_list}
-                {f'<br><br><strong>Failed:</strong><br>{failure_list}' if failure_list else ''}
-                {badge_message}
-            </div>
-            
-            <p><strong>Repository Links:</strong></p>
-            <div>
-                {''.join([f'<a href="https://github.com/{repo.split("/")[0]}/{repo.split("/")[1]}" class="repo-link">{repo}</a>' for repo in success_repos])}
-            </div>
-            
-            <p><strong>Next Steps:</strong></p>
-            <ul style="text-align: left;">
-                <li>Create tags in your repositories to trigger compilation tests</li>
-                <li>View build status using the badge links above</li>
-                <li>Check webhook events in your repository settings</li>
-            </ul>
-        </div>
-    </body>
-    </html>
-    """
+    # Badge status summary, computed in a single pass over the results
+    failed_badge_repos = [repo for repo, success in badge_results.items() if not success]
+    successful_badges = len(badge_results) - len(failed_badge_repos)
     
-    return HTMLResponse(content=success_html)
+    # Rendered in full so a template error takes the 500 path instead of cutting off a 200 page
+    return HTMLResponse(SETUP_SUCCESS_TEMPLATE.render(
+        success_repos=success_repos,
+        failed_repos=failed_repos,
+        add_badges=add_badges,
+        successful_badges=successful_badges,
+        total_badges=len(badge_results),
+        failed_badge_repos=failed_badge_repos,
+    ))
@@ -3,15 +3,24 @@ Webhook processing module
 """
 
 import json
+import asyncio
 import logging
 import re
-from fastapi import HTTPException
-from github_api import generate_jwt_token, get_installation_token, create_github_issue
+from itertools import islice
+from fastapi import HTTPException, BackgroundTasks
+from github_api import generate_jwt_token, get_installation_token, create_github_issue, invalidate_installation_details
 from docker_ops import run_docker_container_async
 from db.database import db_manager
 
 logger = logging.getLogger(__name__)
 
+# Upper bound on tag events processed at once in the background
+MAX_CONCURRENT_TAG_EVENTS = 4
+_tag_event_semaphore = asyncio.Semaphore(MAX_CONCURRENT_TAG_EVENTS)
+
+# Installation payloads can list every repository of an org; only this many names are logged/echoed
+REPO_PREVIEW_LIMIT = 10
+
 
 def _parse_semver(tag: str):
     """Parse tags like vX.Y.Z into a tuple of ints (X, Y, Z). Return None if invalid."""
@@ -38,11 +47,16 @@ def _is_greater_semver(a: str, b: str) -> bool:
     return True
 
 
+def _repo_name_preview(repositories: list) -> list:
+    """First REPO_PREVIEW_LIMIT full names of a webhook repository list, for logs and responses"""
+    return [repo.get("full_name", "") for repo in islice(repositories, REPO_PREVIEW_LIMIT)]
+
+
 async def process_tag_event(git_username: str, repository_name: str, tag_name: str):
     """Process tag creation/push events - validate tag then start tests"""
     try:
         # Get repository info from database
-        repo_info = db_manager.get_repository_info(git_username, repository_name)
+        repo_info = await asyncio.to_thread(db_manager.get_repository_info, git_username, repository_name)
         if not repo_info:
             logger.warning(f"Repository {git_username}/{repository_name} not found in database")
             return False
@@ -73,7 +87,7 @@ async def process_tag_event(git_username: str, repository_name: str, tag_name: s
             }
 
         # Ensure tag has not been processed before
-        if db_manager.has_release_tag(git_username, repository_name, tag_name):
+        if await asyncio.to_thread(db_manager.has_release_tag, git_username, repository_name, tag_name):
             logger.info(f"Ignoring duplicate tag already released: {tag_name}")
             issue_url = None
             try:
@@ -97,7 +111,8 @@ async def process_tag_event(git_username: str, repository_name: str, tag_name: s
             }
 
         # Ensure tag is greater than the last processed semantic tag, if any
-        prev_tags = [t for t in db_manager.get_release_tags(git_username, repository_name) if _parse_semver(t)]
+        release_tags = await asyncio.to_thread(db_manager.get_release_tags, git_username, repository_name)
+        prev_tags = [t for t in release_tags if _parse_semver(t)]
         if prev_tags:
             # Determine the last tag based on the highest MINOR value
             last_tag = max(prev_tags, key=lambda t: _parse_semver(t)[1])
@@ -139,7 +154,7 @@ async def process_tag_event(git_username: str, repository_name: str, tag_name: s
                 "tag": tag_name,
             }
 
-        version_info = db_manager.get_version_info(repo_info['semester_name'], major_minor)
+        version_info = await asyncio.to_thread(db_manager.get_version_info, repo_info['semester_name'], major_minor)
         if not version_info:
             logger.info(f"Ignoring tag with non-existent version in Semester: {major_minor} not found for {repo_info['semester_name']}")
             issue_url = None
@@ -165,7 +180,7 @@ async def process_tag_event(git_username: str, repository_name: str, tag_name: s
             }
             
         # Get semester info for language and file extension
-        semester_info = db_manager.get_semester_info(repo_info['semester_name'])
+        semester_info = await asyncio.to_thread(db_manager.get_semester_info, repo_info['semester_name'])
         
         if not semester_info or not repo_info.get('installation_id'):
             logger.warning(f"Missing semester info or installation_id for repository {git_username}/{repository_name}")
@@ -204,6 +219,16 @@ async def process_tag_event(git_username: str, repository_name: str, tag_name: s
         }
 
 
+async def run_tag_event(git_username: str, repository_name: str, tag_name: str):
+    """Background entry point for tag events; bounded so a burst of tags cannot pile up work"""
+    async with _tag_event_semaphore:
+        result = await process_tag_event(git_username, repository_name, tag_name)
+    if isinstance(result, dict):
+        logger.info(f"Tag event {git_username}/{repository_name}:{tag_name} finished with status {result.get('status')}")
+    else:
+        logger.info(f"Tag event {git_username}/{repository_name}:{tag_name} finished with result {result}")
+
+
 async def process_installation_event(action: str, payload: dict):
     """Process GitHub App installation events"""
     installation = payload.get("installation", {})
@@ -217,13 +242,13 @@ async def process_installation_event(action: str, payload: dict):
         # App was uninstalled - clean up database
         try:
             # Get repositories that will be removed for logging
-            repos_to_remove = db_manager.get_installation_repositories(installation_id)
+            repos_to_remove = await asyncio.to_thread(db_manager.get_installation_repositories, installation_id)
             
             # Remove repositories associated with this installation
-            repo_success = db_manager.remove_repositories_by_installation(installation_id)
+            repo_success = await asyncio.to_thread(db_manager.remove_repositories_by_installation, installation_id)
             
             # Remove users who no longer have any repositories
-            user_success = db_manager.remove_orphaned_users()
+            user_success = await asyncio.to_thread(db_manager.remove_orphaned_users)
             
             if repo_success and user_success:
                 logger.info(f"Successfully cleaned up data for uninstalled app (installation {installation_id})")
@@ -255,16 +280,17 @@ async def process_installation_event(action: str, payload: dict):
     elif action == "created":
         # App was newly installed
         repositories = payload.get("repositories", [])
-        repo_names = [repo.get("full_name", "") for repo in repositories]
+        repo_preview = _repo_name_preview(repositories)
         
-        logger.info(f"App installed on {len(repositories)} repositories: {repo_names}")
+        logger.info(f"App installed on {len(repositories)} repositories: {repo_preview}")
         
         return {
             "status": "success",
             "message": "App installation detected",
             "installation_id": installation_id,
             "account": account_login,
-            "repositories": repo_names,
+            "repository_count": len(repositories),
+            "repositories": repo_preview,
             "next_step": "User should complete setup form"
         }
     
@@ -273,27 +299,22 @@ async def process_installation_event(action: str, payload: dict):
         repositories_added = payload.get("repositories_added", [])
         repositories_removed = payload.get("repositories_removed", [])
         
-        added_names = [repo.get("full_name", "") for repo in repositories_added]
-        removed_names = [repo.get("full_name", "") for repo in repositories_removed]
-        
         # Handle removed repositories
         if repositories_removed:
             try:
-                for repo in repositories_removed:
-                    repo_full_name = repo.get("full_name", "")
-                    if "/" in repo_full_name:
-                        git_username, repository_name = repo_full_name.split("/", 1)
-                        
-                        # Remove test results first
-                        db_manager.remove_test_results_for_repo(git_username, repository_name)
-                        
-                        # Remove repository
-                        db_manager.remove_repository(git_username, repository_name)
+                pairs = [
+                    tuple(name.split("/", 1))
+                    for name in (repo.get("full_name", "") for repo in repositories_removed)
+                    if "/" in name
+                ]
+                
+                # Remove test results and repositories in one transaction
+                await asyncio.to_thread(db_manager.remove_repositories, pairs)
                 
                 # Clean up orphaned users
-                db_manager.remove_orphaned_users()
+                await asyncio.to_thread(db_manager.remove_orphaned_users)
                 
-                logger.info(f"Removed repositories: {removed_names}")
+                logger.info(f"Removed {len(pairs)} repositories: {_repo_name_preview(repositories_removed)}")
             except Exception as e:
                 logger.error(f"Error removing repositories: {e}")
         
@@ -301,8 +322,10 @@ async def process_installation_event(action: str, payload: dict):
             "status": "success",
             "message": f"Repository access updated",
             "installation_id": installation_id,
-            "repositories_added": added_names,
-            "repositories_removed": removed_names
+            "repositories_added": _repo_name_preview(repositories_added),
+            "repositories_removed": _repo_name_preview(repositories_removed),
+            "added_count": len(repositories_added),
+            "removed_count": len(repositories_removed)
         }
     
     return {
@@ -311,52 +334,53 @@ async def process_installation_event(action: str, payload: dict):
     }
 
 
-async def process_webhook_payload(event_type: str, payload: dict):
-    """Main webhook processing function"""
+def queue_tag_event(background_tasks: BackgroundTasks, repository: dict, tag_name: str, source: str):
+    """Schedule a tag from a create or push event; returns the webhook response, or None for a malformed repository name"""
+    repo_name = repository.get("full_name", "unknown")
+    if "/" not in repo_name:
+        return None
+    
+    # Acknowledge GitHub right away; validation and the container start run after the response
+    git_username, repository_name = repo_name.split("/", 1)
+    background_tasks.add_task(run_tag_event, git_username, repository_name, tag_name)
+    return {
+        "status": "queued",
+        "message": f"{source} queued: {tag_name}",
+        "tag": tag_name,
+        "repository": repo_name,
+    }
+
+
+async def process_webhook_payload(event_type: str, payload: dict, background_tasks: BackgroundTasks):
+    """Main webhook processing function; tag events are scheduled on background_tasks"""
     try:
         # Handle tag events specifically  
         if event_type == "create" and payload.get("ref_type") == "tag":
-            tag_name = payload.get("ref")
-            repository = payload.get("repository", {})
-            repo_name = repository.get("full_name", "unknown")
-            
-            # Extract username and repository name
-            if "/" in repo_name:
-                git_username, repository_name = repo_name.split("/", 1)
-                result = await process_tag_event(git_username, repository_name, tag_name)
-                if isinstance(result, dict):
-                    return {**result, "repository": repo_name}
-                # Backward compatibility fallback
-                return {
-                    "status": "success" if result else "error",
-                    "message": (f"Tag event processed: {tag_name}" if result else f"Failed to process tag event: {tag_name}"),
-                    "repository": repo_name,
-                }
+            result = queue_tag_event(background_tasks, payload.get("repository", {}), payload.get("ref"), "Tag event")
+            if result:
+                return result
         
         elif event_type == "push":
-            # Handle push events for tags
+            # Most pushes are branch commits; answer those before looking at anything else
             ref = payload.get("ref", "")
-            if ref.startswith("refs/tags/"):
-                tag_name = ref.replace("refs/tags/", "")
-                repository = payload.get("repository", {})
-                repo_name = repository.get("full_name", "unknown")
-                
-                # Extract username and repository name
-                if "/" in repo_name:
-                    git_username, repository_name = repo_name.split("/", 1)
-                    result = await process_tag_event(git_username, repository_name, tag_name)
-                    if isinstance(result, dict):
-                        return {**result, "repository": repo_name}
-                    return {
-                        "status": "success" if result else "error",
-                        "message": (f"Tag push processed: {tag_name}" if result else f"Failed to process tag push: {tag_name}"),
-                        "repository": repo_name,
-                    }
+            if not ref.startswith("refs/tags/"):
+                return {"status": "ignored", "reason": "non-tag push"}
+            
+            # Handle push events for tags
+            result = queue_tag_event(background_tasks, payload.get("repository", {}), ref.removeprefix("refs/tags/"), "Tag push")
+            if result:
+                return result
         
-        elif event_type == "installation":
-            # Handle GitHub App installation/uninstallation events
-            action = payload.get("action")
-            return await process_installation_event(action, payload)
+        elif event_type in ("installation", "installation_repositories"):
+            # The installation's repository list changed, so cached details are stale
+            installation_id = payload.get("installation", {}).get("id")
+            if installation_id is not None:
+                invalidate_installation_details(installation_id)
+            
+            if event_type == "installation":
+                # Handle GitHub App installation/uninstallation events
+                action = payload.get("action")
+                return await process_installation_event(action, payload)
         
         # For other event types, just acknowledge receipt
         return {